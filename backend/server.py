@@ -1,26 +1,35 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Depends, status, UploadFile, File
+from fastapi import FastAPI, WebSocket, HTTPException, Depends, Query, status, UploadFile, File
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from fastapi.responses import ORJSONResponse, Response
+from pydantic import BaseModel, Field, PlainSerializer, TypeAdapter
+from typing import Annotated, List, Optional, Dict, Any, Set
 import jwt
 import bcrypt
 import uuid
 import os
-import json
-from datetime import datetime, timedelta
+import orjson
+import time
+import hashlib
+import hmac
+import secrets
+from datetime import datetime, timedelta, timezone
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import IndexModel, ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
 import asyncio
+import heapq
 from pathlib import Path
-import aiofiles
-import mimetypes
+import shutil
+from cachetools import TTLCache
+import redis.asyncio as aioredis
 
 # Environment setup
 from dotenv import load_dotenv
 load_dotenv()
 
-app = FastAPI(title="SlackLite API", version="1.0.0")
+app = FastAPI(title="SlackLite API", version="1.0.0", default_response_class=ORJSONResponse)
 
 # CORS middleware
 app.add_middleware(
@@ -29,25 +38,78 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Before", "X-Next-Before-Id"],
 )
 
 # JWT Configuration
 JWT_SECRET = os.getenv("JWT_SECRET", "slack-lite-secret-key-2024")
 JWT_ALGORITHM = "HS256"
+JWT_ALGORITHMS = [JWT_ALGORITHM]
+
+# Reused codec so encode/decode skip per-call setup; exp and sub are mandatory
+_jwt = jwt.PyJWT(options={"require": ["exp", "sub"]})
 JWT_EXPIRATION_HOURS = 24
+JWT_CACHE_TTL_SECONDS = 30
+
+# Verified JWT payloads keyed by SHA-256 of the raw token
+_jwt_cache = TTLCache(maxsize=10000, ttl=JWT_CACHE_TTL_SECONDS)
+
+# Authenticated User objects keyed by user id; dropped whenever the user changes
+USER_CACHE_TTL_SECONDS = 60
+_user_cache = TTLCache(maxsize=5000, ttl=USER_CACHE_TTL_SECONDS)
+
+# Successful password checks, remembered briefly so login retries with the same
+# credentials skip bcrypt. Keys are HMACs under a per-process random secret, so
+# neither the password nor an offline-guessable digest of it is kept in memory
+LOGIN_CACHE_TTL_SECONDS = 5
+_login_cache = TTLCache(maxsize=1024, ttl=LOGIN_CACHE_TTL_SECONDS)
+_login_cache_secret = secrets.token_bytes(32)
+
+# Password hashing cost; existing hashes keep verifying at the cost they were created with
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "10"))
 
 # Security
 security = HTTPBearer()
 
 # Database setup
 MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
-client = AsyncIOMotorClient(MONGO_URL)
+# One client per process; queries past the pool size wait briefly, then fail fast
+MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", "2000"))
+client = AsyncIOMotorClient(
+    MONGO_URL,
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS
+)
 db = client.slacklite
 
+# Redis pub/sub for fan-out across worker processes (single-process when unset)
+REDIS_URL = os.environ.get("REDIS_URL")
+
 # File upload setup
 UPLOAD_DIR = Path("/app/uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
-app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+# Starlette keeps multipart file parts up to this size in memory
+UPLOAD_SPOOL_MAX_SIZE = 1 << 20
+# Uploads with these extensions are reported as images
+IMAGE_EXTENSIONS = {
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".bmp", ".svg",
+    ".ico", ".tif", ".tiff", ".avif", ".heic"
+}
+# Set SERVE_UPLOADS=false when a reverse proxy serves /uploads with sendfile,
+# keeping file downloads off the event loop entirely
+SERVE_UPLOADS = os.environ.get("SERVE_UPLOADS", "true").lower() != "false"
+if SERVE_UPLOADS:
+    app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
+
+# Timestamps are stored as naive UTC; JSON output always carries the UTC
+# offset, matching WebSocket events encoded with OPT_NAIVE_UTC
+def utc_isoformat(value: datetime) -> str:
+    """ISO 8601 string with an explicit UTC offset"""
+    return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).isoformat()
+
+UTCDateTime = Annotated[datetime, PlainSerializer(utc_isoformat, return_type=str, when_used="json")]
 
 # Pydantic Models
 class User(BaseModel):
@@ -56,7 +118,7 @@ class User(BaseModel):
     email: str
     is_online: bool = False
     avatar_url: Optional[str] = None
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: UTCDateTime = Field(default_factory=datetime.utcnow)
 
 class UserCreate(BaseModel):
     username: str
@@ -74,7 +136,7 @@ class Channel(BaseModel):
     created_by: str
     members: List[str] = []
     is_public: bool = True
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: UTCDateTime = Field(default_factory=datetime.utcnow)
     # Ephemeral messaging settings
     ttl_enabled: bool = False
     ttl_seconds: int = 3600  # Default 1 hour
@@ -99,200 +161,763 @@ class Message(BaseModel):
     sender_username: str
     channel_id: Optional[str] = None
     recipient_id: Optional[str] = None
+    conversation_id: Optional[str] = None  # Set on direct messages, see conversation_key()
     message_type: str = "text"  # text, file, image, system, ephemeral
     file_url: Optional[str] = None
     file_name: Optional[str] = None
-    reactions: Dict[str, List[str]] = {}  # emoji -> [user_ids]
-    edited_at: Optional[datetime] = None
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    reactions: Optional[Dict[str, List[str]]] = None  # emoji -> [user_ids]; absent until the first reaction
+    edited_at: Optional[UTCDateTime] = None
+    created_at: UTCDateTime = Field(default_factory=datetime.utcnow)
     # Ephemeral messaging
     is_ephemeral: bool = False
-    expires_at: Optional[datetime] = None
+    expires_at: Optional[UTCDateTime] = None
     ttl_seconds: Optional[int] = None
     # Domain-specific data
     domain_data: Dict[str, Any] = {}
 
+# Upper bounds on user-supplied text, keeping message documents small
+MAX_MESSAGE_LENGTH = 4000
+MAX_EMOJI_LENGTH = 64
+
 class MessageCreate(BaseModel):
-    content: str
+    content: str = Field(max_length=MAX_MESSAGE_LENGTH)
     channel_id: Optional[str] = None
     recipient_id: Optional[str] = None
 
 class MessageEdit(BaseModel):
-    content: str
+    content: str = Field(max_length=MAX_MESSAGE_LENGTH)
 
 class ReactionAdd(BaseModel):
-    emoji: str
+    emoji: str = Field(max_length=MAX_EMOJI_LENGTH)
+
+# Documents read back from Mongo were validated on the way in, so read paths
+# build models with model_construct instead of re-running validation.
+# Read projections limited to the fields of the response models, so `_id`
+# and `password_hash` never leave the database on these paths
+USER_PROJECTION = {"_id": 0, **{field: 1 for field in User.model_fields}}
+LOGIN_PROJECTION = {**USER_PROJECTION, "password_hash": 1}
+CHANNEL_PROJECTION = {"_id": 0, **{field: 1 for field in Channel.model_fields}}
+MESSAGE_PROJECTION = {"_id": 0, **{field: 1 for field in Message.model_fields}}
+CHANNEL_INDEX_PROJECTION = {"_id": 0, "id": 1, "members": 1, "ttl_enabled": 1, "ttl_seconds": 1}
+
+USER_LIST_ADAPTER = TypeAdapter(List[User])
+CHANNEL_LIST_ADAPTER = TypeAdapter(List[Channel])
+MESSAGE_LIST_ADAPTER = TypeAdapter(List[Message])
+
+def list_response(adapter: TypeAdapter, documents: List[dict]) -> Response:
+    """Validate and encode documents in pydantic-core, skipping jsonable_encoder"""
+    content = adapter.dump_json(adapter.validate_python(documents))
+    return Response(content=content, media_type="application/json")
+
+# Messages returned per history page, by default and at most
+MESSAGE_PAGE_SIZE = 50
+MAX_MESSAGE_PAGE_SIZE = 200
+
+# Message history is paged by keyset on (created_at, id), newest first, so a
+# page costs O(limit) however deep the scrollback is
+def message_page_pipeline(message_filter: dict, limit: int) -> List[dict]:
+    """Select the newest `limit` matches, then emit them oldest-first for display"""
+    return [
+        {"$match": message_filter},
+        {"$sort": {"created_at": -1, "id": -1}},
+        {"$limit": limit},
+        {"$sort": {"created_at": 1, "id": 1}},
+        {"$project": MESSAGE_PROJECTION}
+    ]
+
+def message_page_filter(before: Optional[datetime], before_id: Optional[str]) -> dict:
+    """Match messages older than the (before, before_id) cursor"""
+    if before is None:
+        if before_id is not None:
+            raise HTTPException(status_code=422, detail="before_id requires before")
+        return {}
+    if before_id is None:
+        return {"created_at": {"$lt": before}}
+    return {"$or": [
+        {"created_at": {"$lt": before}},
+        {"created_at": before, "id": {"$lt": before_id}}
+    ]}
+
+def message_page_response(messages: List[dict], limit: int) -> Response:
+    """Return an oldest-first page, with the cursor for the next page if it is full"""
+    response = list_response(MESSAGE_LIST_ADAPTER, messages)
+    if messages and len(messages) == limit:
+        oldest = messages[0]
+        response.headers["X-Next-Before"] = oldest["created_at"].isoformat()
+        response.headers["X-Next-Before-Id"] = oldest["id"]
+    return response
 
 # WebSocket Connection Manager
+SEND_QUEUE_SIZE = 100  # Outbound events buffered per socket before it is dropped
+PRESENCE_FLUSH_SECONDS = 0.25  # Window over which presence changes are coalesced
+
+def encode_event(message: dict) -> bytes:
+    """Serialize a WebSocket event; orjson handles the datetime fields natively"""
+    # Kept as UTF-8 bytes all the way to the socket and sent as binary frames
+    return orjson.dumps(message, option=orjson.OPT_NAIVE_UTC)
+
+def channel_ttl(channel: dict) -> Optional[int]:
+    """Message TTL configured on a channel document, or None if disabled"""
+    if channel.get("ttl_enabled", False):
+        return channel.get("ttl_seconds", 3600)
+    return None
+
+# $changeStream is only supported on replica sets (standalone mongod)
+CHANGE_STREAM_UNSUPPORTED_CODES = {40573}
+CHANGE_STREAM_MAX_RETRY_SECONDS = 30
+
+async def follow_change_stream(name: str, open_stream, handle, on_reopen=None):
+    """Feed a change stream to handle(), reopening it with backoff after errors"""
+    delay = 1
+    reopened = False
+    while True:
+        try:
+            async with open_stream() as stream:
+                # Changes missed while the stream was down are caught up by the caller
+                if reopened and on_reopen:
+                    await on_reopen()
+                delay = 1
+                async for change in stream:
+                    await handle(change)
+        except OperationFailure as e:
+            if e.code in CHANGE_STREAM_UNSUPPORTED_CODES:
+                print(f"⚠️ {name} change stream unavailable: {e}")
+                return
+            print(f"❌ {name} change stream error: {e}")
+        except Exception as e:
+            print(f"❌ {name} change stream error: {e}")
+        reopened = True
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, CHANGE_STREAM_MAX_RETRY_SECONDS)
+
 class ConnectionManager:
     def __init__(self):
         self.active_connections: Dict[str, WebSocket] = {}
+        # Each socket is written by its own task from a bounded queue, so a
+        # slow client can neither stall broadcasts nor grow memory unbounded
+        self.send_queues: Dict[str, asyncio.Queue] = {}
+        self.writer_tasks: Dict[str, asyncio.Task] = {}
         self.user_channels: Dict[str, List[str]] = {}
+        # channel_id -> member user_ids, kept in sync on create/join/leave
+        self.channel_members: Dict[str, Set[str]] = {}
+        # channel_id -> message TTL in seconds, None when ephemeral messaging is off
+        self.channel_ttls: Dict[str, Optional[int]] = {}
+        # Set when REDIS_URL is configured; events are then published instead
+        # of delivered directly so every worker can reach its own sockets
+        self.redis: Optional[aioredis.Redis] = None
+        # user_id -> latest presence change, flushed as one presence_bulk event
+        self.presence_buffer: Dict[str, dict] = {}
+        self.presence_pending = asyncio.Event()
         
     async def connect(self, websocket: WebSocket, user_id: str, username: str):
         await websocket.accept()
+        # A reconnect replaces the user's previous socket and its writer
+        previous = self.release_connection(user_id)
+        if previous is not None:
+            asyncio.create_task(self.close_quietly(previous))
+        queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
         self.active_connections[user_id] = websocket
+        self.send_queues[user_id] = queue
+        self.writer_tasks[user_id] = asyncio.create_task(self.write_loop(user_id, websocket, queue))
         
         # Update user online status
         await db.users.update_one(
             {"id": user_id}, 
             {"$set": {"is_online": True}}
         )
+        _user_cache.pop(user_id, None)
         
         # Notify all users about online status
-        await self.broadcast_user_status(user_id, username, True)
+        self.queue_user_status(user_id, username, True)
         
-    async def disconnect(self, user_id: str, username: str):
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
+    async def disconnect(self, websocket: WebSocket, user_id: str, username: str):
+        current = self.active_connections.get(user_id)
+        if current is not None and current is not websocket:
+            return  # A replaced socket closing; the user is still connected
+        if current is websocket:
+            self.release_connection(user_id)
             
         # Update user offline status
         await db.users.update_one(
             {"id": user_id}, 
             {"$set": {"is_online": False}}
         )
+        _user_cache.pop(user_id, None)
         
         # Notify all users about offline status
-        await self.broadcast_user_status(user_id, username, False)
+        self.queue_user_status(user_id, username, False)
         
     async def send_personal_message(self, message: dict, user_id: str):
-        if user_id in self.active_connections:
-            await self.active_connections[user_id].send_text(json.dumps(message))
+        await self.send_to_users(message, [user_id])
+        
+    async def send_to_users(self, message: dict, user_ids):
+        """Serialize a message once and deliver it to each of the given users"""
+        payload = encode_event(message)
+        if self.redis:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for user_id in user_ids:
+                    pipe.publish(f"chat:dm:{user_id}", payload)
+                await pipe.execute()
+        else:
+            self.send_to_connections(payload, user_ids)
+            
+    async def load_channel_members(self):
+        """Build the channel membership and TTL indexes from the database"""
+        channels = await db.channels.find({}, CHANNEL_INDEX_PROJECTION).to_list(length=None)
+        self.channel_members = {
+            channel["id"]: set(channel.get("members", [])) for channel in channels
+        }
+        self.channel_ttls = {channel["id"]: channel_ttl(channel) for channel in channels}
+        
+    async def get_channel_members(self, channel_id: str) -> Set[str]:
+        """Members of a channel, loaded into the index on first use"""
+        members = self.channel_members.get(channel_id)
+        if members is None:
+            channel = await db.channels.find_one({"id": channel_id}, CHANNEL_INDEX_PROJECTION)
+            loaded = set(channel.get("members", [])) if channel else set()
+            members = self.channel_members.setdefault(channel_id, loaded)
+            if channel:
+                self.channel_ttls[channel_id] = channel_ttl(channel)
+        return members
+        
+    async def get_channel_ttl(self, channel_id: str) -> Optional[int]:
+        """TTL for messages sent to a channel, loaded into the index on first use"""
+        if channel_id not in self.channel_ttls:
+            # Loaded on its own: Redis membership events can create the members
+            # entry on this worker without ever loading the channel's TTL
+            channel = await db.channels.find_one({"id": channel_id}, CHANNEL_INDEX_PROJECTION)
+            if channel is None:
+                return None
+            self.channel_ttls[channel_id] = channel_ttl(channel)
+        return self.channel_ttls.get(channel_id)
+        
+    async def watch_channel_changes(self):
+        """Keep the membership and TTL indexes in step with channel writes from any process"""
+        async def apply_change(change):
+            channel = change.get("fullDocument")
+            if channel:
+                self.channel_members[channel["id"]] = set(channel.get("members", []))
+                self.channel_ttls[channel["id"]] = channel_ttl(channel)
+        
+        # Change streams need a replica set; without one, Redis membership events still apply
+        await follow_change_stream(
+            "Channel",
+            lambda: db.channels.watch(
+                [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}],
+                full_document="updateLookup"
+            ),
+            apply_change,
+            on_reopen=self.load_channel_members
+        )
+        
+    async def add_channel_member(self, channel_id: str, user_id: str):
+        await self.update_channel_membership(channel_id, user_id, True)
+        
+    async def remove_channel_member(self, channel_id: str, user_id: str):
+        await self.update_channel_membership(channel_id, user_id, False)
+        
+    async def update_channel_membership(self, channel_id: str, user_id: str, is_member: bool):
+        self.apply_membership_change(channel_id, user_id, is_member)
+        # Other workers keep their own index and learn about the change via Redis
+        if self.redis:
+            await self.redis.publish(
+                f"chat:members:{channel_id}",
+                orjson.dumps({"user_id": user_id, "is_member": is_member})
+            )
+            
+    def apply_membership_change(self, channel_id: str, user_id: str, is_member: bool):
+        if is_member:
+            self.channel_members.setdefault(channel_id, set()).add(user_id)
+        else:
+            self.channel_members.get(channel_id, set()).discard(user_id)
+            
+    def send_to_connections(self, payload: bytes, user_ids):
+        """Queue a serialized payload for every connected user in user_ids"""
+        for user_id in user_ids:
+            queue = self.send_queues.get(user_id)
+            if queue is None:
+                continue
+            try:
+                queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                # Slow consumer: drop it rather than buffer without bound
+                self.drop_connection(user_id, self.active_connections.get(user_id))
+                
+    async def write_loop(self, user_id: str, websocket: WebSocket, queue: asyncio.Queue):
+        """Drain a connection's queue onto its socket"""
+        try:
+            while True:
+                # Events queued since the last send go out as one JSON array frame
+                batch = [await queue.get()]
+                while not queue.empty():
+                    batch.append(queue.get_nowait())
+                payload = batch[0] if len(batch) == 1 else b"[" + b",".join(batch) + b"]"
+                await websocket.send_bytes(payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.drop_connection(user_id, websocket)
+            
+    def release_connection(self, user_id: str) -> Optional[WebSocket]:
+        """Forget a user's socket and stop its writer task"""
+        self.send_queues.pop(user_id, None)
+        writer = self.writer_tasks.pop(user_id, None)
+        if writer and writer is not asyncio.current_task():
+            writer.cancel()
+        return self.active_connections.pop(user_id, None)
+        
+    def drop_connection(self, user_id: str, websocket: Optional[WebSocket]):
+        """Close a failed or lagging socket; its endpoint handler then runs disconnect()"""
+        # The user may already have reconnected on a new socket
+        if websocket is None or self.active_connections.get(user_id) is not websocket:
+            return
+        self.release_connection(user_id)
+        asyncio.create_task(self.close_quietly(websocket))
+        
+    @staticmethod
+    async def close_quietly(websocket: WebSocket):
+        try:
+            await websocket.close(code=1013)
+        except Exception:
+            pass  # Connection might be closed
             
     async def broadcast_to_channel(self, message: dict, channel_id: str):
-        # Get channel members
-        channel = await db.channels.find_one({"id": channel_id})
-        if channel:
-            for member_id in channel.get("members", []):
-                if member_id in self.active_connections:
-                    await self.active_connections[member_id].send_text(json.dumps(message))
+        payload = encode_event(message)
+        if self.redis:
+            await self.redis.publish(f"chat:channel:{channel_id}", payload)
+        else:
+            self.send_to_connections(payload, await self.get_channel_members(channel_id))
+            
+    async def start_pubsub(self, redis_url: str):
+        """Route channel, DM, membership and presence events through Redis"""
+        self.redis = aioredis.from_url(redis_url)
+        asyncio.create_task(self.relay_pubsub())
+        
+    async def relay_pubsub(self):
+        """Forward events published by any worker to the sockets held by this one"""
+        while True:
+            try:
+                pubsub = self.redis.pubsub()
+                await pubsub.psubscribe("chat:channel:*", "chat:dm:*", "chat:members:*", "chat:presence:*")
+                # Membership events published while unsubscribed are lost, so
+                # rebuild the index from the database once listening again
+                await self.load_channel_members()
+                async for event in pubsub.listen():
+                    if event["type"] != "pmessage":
+                        continue
+                    
+                    _, kind, target = event["channel"].decode('utf-8').split(":", 2)
+                    if kind == "channel":
+                        self.send_to_connections(event["data"], await self.get_channel_members(target))
+                        schedule_relayed_expiry(event["data"])
+                    elif kind == "dm":
+                        self.send_to_connections(event["data"], [target])
+                        schedule_relayed_expiry(event["data"])
+                    elif kind == "members":
+                        change = orjson.loads(event["data"])
+                        self.apply_membership_change(target, change["user_id"], change["is_member"])
+                    elif kind == "presence":
+                        # Status flips on another worker leave this worker's cached users stale
+                        for change in orjson.loads(event["data"])["changes"]:
+                            _user_cache.pop(change["user_id"], None)
+                        self.send_to_connections(event["data"], list(self.active_connections))
+            except Exception as e:
+                print(f"❌ Pub/sub relay error: {e}")
+                await asyncio.sleep(1)
                     
-    async def broadcast_user_status(self, user_id: str, username: str, is_online: bool):
-        status_message = {
-            "type": "user_status",
+    def queue_user_status(self, user_id: str, username: str, is_online: bool):
+        """Record a presence change for the next presence_bulk flush"""
+        # A reconnect inside one window collapses to the user's final state
+        self.presence_buffer[user_id] = {
             "user_id": user_id,
             "username": username,
-            "is_online": is_online,
-            "timestamp": datetime.utcnow().isoformat()
+            "is_online": is_online
         }
+        self.presence_pending.set()
         
-        # Broadcast to all connected users
-        for connection in self.active_connections.values():
+    async def flush_presence(self):
+        """Broadcast buffered presence changes at most once per window"""
+        while True:
+            await self.presence_pending.wait()
+            await asyncio.sleep(PRESENCE_FLUSH_SECONDS)
+            self.presence_pending.clear()
+            changes, self.presence_buffer = self.presence_buffer, {}
             try:
-                await connection.send_text(json.dumps(status_message))
-            except:
-                pass  # Connection might be closed
+                await self.broadcast_presence(list(changes.values()))
+            except Exception as e:
+                print(f"❌ Presence flush error: {e}")
+                
+    async def broadcast_presence(self, changes: List[dict]):
+        presence_message = {
+            "type": "presence_bulk",
+            "changes": changes,
+            "timestamp": datetime.utcnow()
+        }
+        
+        # Broadcast to all connected users, on every worker when Redis is configured
+        payload = encode_event(presence_message)
+        if self.redis:
+            await self.redis.publish("chat:presence:bulk", payload)
+        else:
+            self.send_to_connections(payload, list(self.active_connections))
 
 manager = ConnectionManager()
 
-# Ephemeral messaging helper functions
-async def setup_message_ttl():
-    """Setup TTL index for ephemeral messages"""
+# Database indexes for the hot query patterns
+async def ensure_indexes():
+    """Create indexes backing user, channel and message lookups"""
     try:
-        # Create TTL index on expires_at field
-        await db.messages.create_index("expires_at", expireAfterSeconds=0)
-        print("✅ TTL index created for ephemeral messages")
+        # One createIndexes command per collection, issued concurrently
+        await asyncio.gather(
+            db.users.create_indexes([
+                IndexModel("id", unique=True),
+                IndexModel("username", unique=True),
+                IndexModel("email", unique=True)
+            ]),
+            db.channels.create_indexes([
+                IndexModel("id", unique=True),
+                IndexModel("name")
+            ]),
+            db.messages.create_indexes([
+                # Edits and reactions address messages by id
+                IndexModel("id", unique=True),
+                # TTL index removing ephemeral messages once expires_at passes
+                IndexModel("expires_at", expireAfterSeconds=0),
+                # History pages sort on (created_at, id) so the cursor is unique
+                IndexModel([("channel_id", 1), ("created_at", -1), ("id", -1)]),
+                IndexModel([("conversation_id", 1), ("created_at", -1), ("id", -1)])
+            ])
+        )
+        print("✅ Database indexes ensured")
     except Exception as e:
-        print(f"⚠️ TTL index setup warning: {e}")
+        print(f"⚠️ Index setup warning: {e}")
+
+# Direct messages are keyed by their participant pair, so history reads
+# seek a single index range instead of unioning two `$or` branches
+def conversation_key(user_id: str, other_user_id: str) -> str:
+    """Stable id for the direct conversation between two users"""
+    return ":".join(sorted((user_id, other_user_id)))
 
-async def calculate_expiry_time(channel_id: str) -> Optional[datetime]:
+# One-off data migrations run on the first worker to claim them in the
+# `migrations` collection; delete a migration's document to run it again
+async def claim_migration(name: str) -> bool:
+    """True if this worker is the one that should run the migration"""
+    try:
+        claim = await db.migrations.update_one(
+            {"_id": name},
+            {"$setOnInsert": {"started_at": datetime.utcnow()}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return False
+    return claim.upserted_id is not None
+
+async def complete_migration(name: str, **result):
+    await db.migrations.update_one({"_id": name}, {"$set": {"completed_at": datetime.utcnow(), **result}})
+
+async def release_migration(name: str):
+    """Give up a failed migration's claim so the next startup retries it"""
+    await db.migrations.delete_one({"_id": name})
+
+CONVERSATION_BACKFILL_MIGRATION = "backfill_conversation_ids"
+LEGACY_INDEX_MIGRATION = "drop_legacy_message_indexes"
+# Message indexes superseded by the (created_at, id) keyset and conversation_id ones
+LEGACY_MESSAGE_INDEXES = [
+    "channel_id_1_created_at_-1",
+    "sender_id_1_recipient_id_1_created_at_-1",
+    "recipient_id_1_sender_id_1_created_at_-1"
+]
+
+async def backfill_conversation_ids():
+    """Key direct messages stored before conversation_id existed, once per database"""
+    # The filter has no supporting index, so only the claiming worker scans
+    if not await claim_migration(CONVERSATION_BACKFILL_MIGRATION):
+        return
+    
+    try:
+        result = await db.messages.update_many(
+            {"recipient_id": {"$type": "string"}, "conversation_id": {"$exists": False}},
+            [{"$set": {"conversation_id": {"$cond": [
+                {"$lt": ["$sender_id", "$recipient_id"]},
+                {"$concat": ["$sender_id", ":", "$recipient_id"]},
+                {"$concat": ["$recipient_id", ":", "$sender_id"]}
+            ]}}}]
+        )
+        await complete_migration(CONVERSATION_BACKFILL_MIGRATION, modified=result.modified_count)
+        if result.modified_count:
+            print(f"✅ Backfilled conversation ids on {result.modified_count} direct messages")
+    except Exception as e:
+        await release_migration(CONVERSATION_BACKFILL_MIGRATION)
+        print(f"⚠️ Conversation id backfill warning: {e}")
+
+async def drop_legacy_message_indexes():
+    """Drop message indexes that no query uses but every insert still maintains"""
+    if not await claim_migration(LEGACY_INDEX_MIGRATION):
+        return
+    
+    try:
+        existing = await db.messages.index_information()
+        dropped = [name for name in LEGACY_MESSAGE_INDEXES if name in existing]
+        for name in dropped:
+            await db.messages.drop_index(name)
+        await complete_migration(LEGACY_INDEX_MIGRATION, dropped=dropped)
+        if dropped:
+            print(f"✅ Dropped legacy message indexes: {', '.join(dropped)}")
+    except Exception as e:
+        await release_migration(LEGACY_INDEX_MIGRATION)
+        print(f"⚠️ Legacy index cleanup warning: {e}")
+
+# Ephemeral messaging helper functions
+
+def calculate_expiry_time(ttl_seconds: Optional[int]) -> Optional[datetime]:
     """Calculate message expiry time based on channel settings"""
-    channel = await db.channels.find_one({"id": channel_id})
-    if channel and channel.get("ttl_enabled", False):
-        ttl_seconds = channel.get("ttl_seconds", 3600)
+    if ttl_seconds:
         return datetime.utcnow() + timedelta(seconds=ttl_seconds)
     return None
 
-async def cleanup_expired_messages():
-    """Background job to clean up expired messages and notify clients"""
+async def enable_message_pre_images():
+    """Record pre-images of messages so deletes carry their routing fields (MongoDB 6.0+)"""
+    try:
+        await db.command("collMod", "messages", changeStreamPreAndPostImages={"enabled": True})
+    except Exception as e:
+        # Needs collMod rights; the expiry watcher still runs if pre-images are already on
+        print(f"⚠️ Message pre-image setup warning: {e}")
+
+async def watch_expired_messages():
+    """Notify clients as soon as the TTL monitor deletes an ephemeral message"""
+    async def notify_expired(change):
+        message = change.get("fullDocumentBeforeChange")
+        if not message or not message.get("is_ephemeral"):
+            return
+        
+        payload = encode_event({
+            "type": "message_expired",
+            "message_id": message["id"],
+            "channel_id": message.get("channel_id")
+        })
+        
+        # Every worker runs this watcher, so only local sockets are served
+        if message.get("channel_id"):
+            manager.send_to_connections(payload, await manager.get_channel_members(message["channel_id"]))
+        elif message.get("recipient_id"):
+            manager.send_to_connections(payload, [message["recipient_id"], message["sender_id"]])
+    
+    await follow_change_stream(
+        "Message expiry",
+        lambda: db.messages.watch(
+            [{"$match": {"operationType": "delete"}}],
+            full_document_before_change="whenAvailable"
+        ),
+        notify_expired
+    )
+
+# Expiry warnings are timed in-process from expires_at. Every worker schedules
+# each ephemeral message it sees (sent locally, relayed through Redis, or
+# pending at startup) and warns only its own sockets, so no warning crosses
+# Redis and a worker restart loses none
+EXPIRY_WARNING_SECONDS = 30
+# (warn_at, message_id, expires_at, channel_id, recipient_id, sender_id)
+_expiry_heap: List[tuple] = []
+# Ids in _expiry_heap; a DM is relayed once per participant
+_expiry_scheduled: Set[str] = set()
+_expiry_wakeup = asyncio.Event()
+
+def schedule_expiry_warning(message: dict):
+    """Queue a message_expiring notification for an ephemeral message"""
+    if message["id"] in _expiry_scheduled:
+        return
+    _expiry_scheduled.add(message["id"])
+    expires_at = message["expires_at"]
+    warn_at = expires_at - timedelta(seconds=EXPIRY_WARNING_SECONDS)
+    heapq.heappush(_expiry_heap, (
+        warn_at, message["id"], expires_at,
+        message.get("channel_id"), message.get("recipient_id"), message["sender_id"]
+    ))
+    # Wake the timer in case this warning is due before the one it sleeps on
+    _expiry_wakeup.set()
+
+def schedule_relayed_expiry(payload: bytes):
+    """Schedule the warning for an ephemeral new_message relayed from any worker"""
+    # Only events that can be ephemeral are decoded
+    if b'"is_ephemeral":true' not in payload:
+        return
+    event = orjson.loads(payload)
+    if event.get("type") != "new_message" or not event.get("expires_at"):
+        return
+    expires_at = datetime.fromisoformat(event["expires_at"]).astimezone(timezone.utc).replace(tzinfo=None)
+    schedule_expiry_warning({**event, "expires_at": expires_at})
+
+async def load_expiry_warnings():
+    """Schedule warnings for ephemeral messages that are still pending at startup"""
+    try:
+        pending = await db.messages.find(
+            {"expires_at": {"$gt": datetime.utcnow()}, "is_ephemeral": True},
+            {"_id": 0, "id": 1, "expires_at": 1, "channel_id": 1, "recipient_id": 1, "sender_id": 1}
+        ).to_list(length=None)
+        for message in pending:
+            schedule_expiry_warning(message)
+    except Exception as e:
+        print(f"⚠️ Expiry warning reload warning: {e}")
+
+async def send_expiry_warnings():
+    """Sleep until the earliest pending warning is due, then send it"""
     while True:
+        _expiry_wakeup.clear()
+        delay = (_expiry_heap[0][0] - datetime.utcnow()).total_seconds() if _expiry_heap else None
+        if delay is None or delay > 0:
+            try:
+                await asyncio.wait_for(_expiry_wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        
+        _, message_id, expires_at, channel_id, recipient_id, sender_id = heapq.heappop(_expiry_heap)
+        _expiry_scheduled.discard(message_id)
+        payload = encode_event({
+            "type": "message_expiring",
+            "message_id": message_id,
+            "channel_id": channel_id,
+            "expires_at": expires_at
+        })
         try:
-            # Find messages that are about to expire (within 30 seconds)
-            expiring_soon = await db.messages.find({
-                "expires_at": {
-                    "$gte": datetime.utcnow(),
-                    "$lte": datetime.utcnow() + timedelta(seconds=30)
-                },
-                "is_ephemeral": True
-            }).to_list(length=None)
-            
-            # Notify clients about expiring messages
-            for message in expiring_soon:
-                expiry_notification = {
-                    "type": "message_expiring",
-                    "message_id": message["id"],
-                    "channel_id": message.get("channel_id"),
-                    "expires_at": message["expires_at"].isoformat()
-                }
-                
-                if message.get("channel_id"):
-                    await manager.broadcast_to_channel(expiry_notification, message["channel_id"])
-                elif message.get("recipient_id"):
-                    await manager.send_personal_message(expiry_notification, message["recipient_id"])
-                    await manager.send_personal_message(expiry_notification, message["sender_id"])
-            
-            await asyncio.sleep(30)  # Check every 30 seconds
+            if channel_id:
+                manager.send_to_connections(payload, await manager.get_channel_members(channel_id))
+            elif recipient_id:
+                manager.send_to_connections(payload, [recipient_id, sender_id])
         except Exception as e:
-            print(f"❌ Cleanup job error: {e}")
-            await asyncio.sleep(60)  # Wait longer on error
+            print(f"❌ Expiry warning error: {e}")
 
-# Start background cleanup task
+# Start background tasks
 @app.on_event("startup")
 async def startup_event():
-    await setup_message_ttl()
-    # Start background cleanup task
-    asyncio.create_task(cleanup_expired_messages())
+    await ensure_indexes()
+    await enable_message_pre_images()
+    asyncio.create_task(backfill_conversation_ids())
+    asyncio.create_task(drop_legacy_message_indexes())
+    await manager.load_channel_members()
+    asyncio.create_task(manager.watch_channel_changes())
+    if REDIS_URL:
+        await manager.start_pubsub(REDIS_URL)
+    asyncio.create_task(manager.flush_presence())
+    # Push expiry notifications as messages are deleted
+    asyncio.create_task(watch_expired_messages())
+    await load_expiry_warnings()
+    asyncio.create_task(send_expiry_warnings())
 
 # Authentication helpers
-def hash_password(password: str) -> str:
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
+# bcrypt is CPU-bound, so it runs on a worker thread to keep the event loop
+# free for WebSocket traffic while a login or registration is in progress
+async def hash_password(password: str) -> str:
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
+    hashed = await asyncio.to_thread(bcrypt.hashpw, password.encode('utf-8'), salt)
     return hashed.decode('utf-8')
 
-def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+async def verify_password(password: str, hashed: str) -> bool:
+    return await asyncio.to_thread(bcrypt.checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+
+async def verify_login_password(password: str, hashed: str) -> bool:
+    """verify_password, short-circuited for credentials that just succeeded"""
+    # Keying on the stored hash means a password change invalidates the entry
+    key = hmac.new(_login_cache_secret, f"{hashed}\0{password}".encode('utf-8'), hashlib.sha256).digest()
+    if key in _login_cache:
+        return True
+    
+    if not await verify_password(password, hashed):
+        return False
+    _login_cache[key] = True
+    return True
 
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(hours=JWT_EXPIRATION_HOURS)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGORITHM)
+    encoded_jwt = _jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGORITHM)
     return encoded_jwt
 
+def decode_access_token(token: str) -> dict:
+    """Verify a JWT, reusing the payload of a recently verified identical token"""
+    key = hashlib.sha256(token.encode('utf-8')).digest()
+    payload = _jwt_cache.get(key)
+    # Cached entries are still bounded by the token's own expiry
+    if payload is not None and payload.get("exp", 0) > time.time():
+        return payload
+    
+    payload = _jwt.decode(token, JWT_SECRET, algorithms=JWT_ALGORITHMS)
+    _jwt_cache[key] = payload
+    return payload
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
         token = credentials.credentials
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        payload = decode_access_token(token)
         user_id: str = payload.get("sub")
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid authentication credentials")
     except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
     
-    user = await db.users.find_one({"id": user_id})
+    user = await load_user(user_id)
     if user is None:
         raise HTTPException(status_code=401, detail="User not found")
-    return User(**user)
+    return user
+
+async def load_user(user_id: str) -> Optional[User]:
+    """Fetch a user through the short-lived user cache"""
+    user = _user_cache.get(user_id)
+    if user is None:
+        user_doc = await db.users.find_one({"id": user_id}, USER_PROJECTION)
+        if user_doc is None:
+            return None
+        user = User.model_construct(**user_doc)
+        _user_cache[user_id] = user
+    return user
+
+# File upload helpers
+def save_upload(source, destination: Path, size: Optional[int]) -> int:
+    """Copy an uploaded file to disk in one pass; meant to run on a worker thread"""
+    source.seek(0)
+    with open(destination, 'wb') as out:
+        # Parts larger than Starlette's spool limit already sit in a temporary
+        # file and are copied kernel-side; asking a smaller, in-memory spool
+        # for its fileno would force it to disk first
+        if hasattr(os, "sendfile") and size is not None and size > UPLOAD_SPOOL_MAX_SIZE:
+            try:
+                return sendfile_copy(source.fileno(), out.fileno())
+            except OSError:
+                out.seek(0)
+                out.truncate()
+        shutil.copyfileobj(source, out, UPLOAD_CHUNK_SIZE)
+        return out.tell()
+
+def sendfile_copy(in_fd: int, out_fd: int) -> int:
+    """Copy a whole file between descriptors without passing through user space"""
+    offset = 0
+    while sent := os.sendfile(out_fd, in_fd, offset, UPLOAD_CHUNK_SIZE):
+        offset += sent
+    return offset
 
 # API Routes
 
 @app.post("/api/auth/register")
 async def register(user_data: UserCreate):
-    # Check if user exists
-    existing_user = await db.users.find_one({
-        "$or": [{"username": user_data.username}, {"email": user_data.email}]
-    })
-    if existing_user:
-        raise HTTPException(status_code=400, detail="Username or email already exists")
-    
     # Create new user
-    hashed_password = hash_password(user_data.password)
+    hashed_password = await hash_password(user_data.password)
     user = User(username=user_data.username, email=user_data.email)
     
-    # Store in database
+    # Insert only if neither the username nor the email is taken; the unique
+    # indexes catch a concurrent signup that slips between match and insert
     user_doc = user.dict()
     user_doc["password_hash"] = hashed_password
-    await db.users.insert_one(user_doc)
+    try:
+        result = await db.users.update_one(
+            {"$or": [{"username": user_data.username}, {"email": user_data.email}]},
+            {"$setOnInsert": user_doc},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        result = None
+    if result is None or result.upserted_id is None:
+        raise HTTPException(status_code=400, detail="Username or email already exists")
     
     # Create access token
     access_token = create_access_token(data={"sub": user.id})
@@ -302,11 +927,11 @@ async def register(user_data: UserCreate):
 @app.post("/api/auth/login")
 async def login(login_data: UserLogin):
     # Find user
-    user_doc = await db.users.find_one({"username": login_data.username})
-    if not user_doc or not verify_password(login_data.password, user_doc["password_hash"]):
+    user_doc = await db.users.find_one({"username": login_data.username}, LOGIN_PROJECTION)
+    if not user_doc or not await verify_login_password(login_data.password, user_doc.pop("password_hash")):
         raise HTTPException(status_code=401, detail="Invalid username or password")
     
-    user = User(**user_doc)
+    user = User.model_construct(**user_doc)
     access_token = create_access_token(data={"sub": user.id})
     
     return {"access_token": access_token, "token_type": "bearer", "user": user}
@@ -317,14 +942,14 @@ async def get_me(current_user: User = Depends(get_current_user)):
 
 @app.get("/api/users", response_model=List[User])
 async def get_users(current_user: User = Depends(get_current_user)):
-    users = await db.users.find({}, {"password_hash": 0}).to_list(length=None)
-    return [User(**user) for user in users]
+    users = await db.users.find({}, USER_PROJECTION).to_list(length=None)
+    return list_response(USER_LIST_ADAPTER, users)
 
 # Channel endpoints
 @app.post("/api/channels", response_model=Channel)
 async def create_channel(channel_data: ChannelCreate, current_user: User = Depends(get_current_user)):
     # Check if channel name exists
-    existing_channel = await db.channels.find_one({"name": channel_data.name})
+    existing_channel = await db.channels.find_one({"name": channel_data.name}, {"_id": 1})
     if existing_channel:
         raise HTTPException(status_code=400, detail="Channel name already exists")
     
@@ -340,7 +965,10 @@ async def create_channel(channel_data: ChannelCreate, current_user: User = Depen
         domain_config=channel_data.domain_config
     )
     
-    await db.channels.insert_one(channel.dict())
+    channel_doc = channel.dict()
+    await db.channels.insert_one(channel_doc)
+    manager.channel_ttls[channel.id] = channel_ttl(channel_doc)
+    await manager.add_channel_member(channel.id, current_user.id)
     return channel
 
 @app.get("/api/channels", response_model=List[Channel])
@@ -351,12 +979,12 @@ async def get_channels(current_user: User = Depends(get_current_user)):
             {"is_public": True},
             {"members": current_user.id}
         ]
-    }).to_list(length=None)
-    return [Channel(**channel) for channel in channels]
+    }, CHANNEL_PROJECTION).to_list(length=None)
+    return list_response(CHANNEL_LIST_ADAPTER, channels)
 
 @app.post("/api/channels/{channel_id}/join")
 async def join_channel(channel_id: str, current_user: User = Depends(get_current_user)):
-    channel = await db.channels.find_one({"id": channel_id})
+    channel = await db.channels.find_one({"id": channel_id}, {"_id": 0, "is_public": 1})
     if not channel:
         raise HTTPException(status_code=404, detail="Channel not found")
     
@@ -368,6 +996,7 @@ async def join_channel(channel_id: str, current_user: User = Depends(get_current
         {"id": channel_id},
         {"$addToSet": {"members": current_user.id}}
     )
+    await manager.add_channel_member(channel_id, current_user.id)
     
     return {"message": "Joined channel successfully"}
 
@@ -377,6 +1006,7 @@ async def leave_channel(channel_id: str, current_user: User = Depends(get_curren
         {"id": channel_id},
         {"$pull": {"members": current_user.id}}
     )
+    await manager.remove_channel_member(channel_id, current_user.id)
     
     return {"message": "Left channel successfully"}
 
@@ -389,11 +1019,10 @@ async def send_message(message_data: MessageCreate, current_user: User = Depends
     ttl_seconds = None
     
     if message_data.channel_id:
-        expires_at = await calculate_expiry_time(message_data.channel_id)
-        if expires_at:
-            is_ephemeral = True
-            channel = await db.channels.find_one({"id": message_data.channel_id})
-            ttl_seconds = channel.get("ttl_seconds", 3600)
+        # Served from the manager's channel index, so no database round-trip
+        ttl_seconds = await manager.get_channel_ttl(message_data.channel_id)
+        expires_at = calculate_expiry_time(ttl_seconds)
+        is_ephemeral = expires_at is not None
     
     message = Message(
         content=message_data.content,
@@ -401,95 +1030,105 @@ async def send_message(message_data: MessageCreate, current_user: User = Depends
         sender_username=current_user.username,
         channel_id=message_data.channel_id,
         recipient_id=message_data.recipient_id,
+        conversation_id=conversation_key(current_user.id, message_data.recipient_id) if message_data.recipient_id else None,
         is_ephemeral=is_ephemeral,
         expires_at=expires_at,
         ttl_seconds=ttl_seconds
     )
     
-    await db.messages.insert_one(message.dict())
-    
-    # Broadcast message via WebSocket
-    message_dict = message.dict()
-    message_dict["type"] = "new_message"
+    # A new message has no reactions; the field is only stored once one is added
+    message_doc = message.model_dump(exclude={"reactions"})
+    # The event shares the document's values; copy before insert_one adds `_id`
+    message_event = {**message_doc, "type": "new_message"}
     
+    # Broadcast message via WebSocket while the insert is in flight;
+    # the response still waits for both
+    deliveries = []
     if message.channel_id:
-        await manager.broadcast_to_channel(message_dict, message.channel_id)
+        deliveries.append(manager.broadcast_to_channel(message_event, message.channel_id))
     elif message.recipient_id:
-        await manager.send_personal_message(message_dict, message.recipient_id)
-        await manager.send_personal_message(message_dict, current_user.id)
+        deliveries.append(manager.send_to_users(message_event, [message.recipient_id, current_user.id]))
+    await asyncio.gather(db.messages.insert_one(message_doc), *deliveries)
+    # With Redis, every worker (this one included) schedules from the relayed event
+    if message.is_ephemeral and manager.redis is None:
+        schedule_expiry_warning(message_doc)
     
-    return message
+    return Response(content=message.model_dump_json(), media_type="application/json")
 
-@app.get("/api/messages/channel/{channel_id}")
-async def get_channel_messages(channel_id: str, skip: int = 0, limit: int = 50, current_user: User = Depends(get_current_user)):
-    # Check if user is member of channel
-    channel = await db.channels.find_one({"id": channel_id})
-    if not channel or current_user.id not in channel.get("members", []):
+@app.get("/api/messages/channel/{channel_id}", response_model=List[Message])
+async def get_channel_messages(channel_id: str, limit: int = Query(MESSAGE_PAGE_SIZE, ge=1, le=MAX_MESSAGE_PAGE_SIZE), before: Optional[datetime] = None, before_id: Optional[str] = None, current_user: User = Depends(get_current_user)):
+    message_filter = {"channel_id": channel_id, **message_page_filter(before, before_id)}
+    
+    # Check membership and load the requested page in a single round-trip
+    result = await db.channels.aggregate([
+        {"$match": {"id": channel_id, "members": current_user.id}},
+        {"$lookup": {
+            "from": "messages",
+            "pipeline": message_page_pipeline(message_filter, limit),
+            "as": "messages"
+        }},
+        {"$project": {"_id": 0, "messages": 1}}
+    ]).to_list(length=1)
+    if not result:
         raise HTTPException(status_code=403, detail="Not a member of this channel")
     
-    messages = await db.messages.find({"channel_id": channel_id}).sort("created_at", -1).skip(skip).limit(limit).to_list(length=None)
-    return [Message(**msg) for msg in reversed(messages)]
+    return message_page_response(result[0]["messages"], limit)
 
-@app.get("/api/messages/direct/{user_id}")
-async def get_direct_messages(user_id: str, skip: int = 0, limit: int = 50, current_user: User = Depends(get_current_user)):
-    messages = await db.messages.find({
-        "$or": [
-            {"sender_id": current_user.id, "recipient_id": user_id},
-            {"sender_id": user_id, "recipient_id": current_user.id}
-        ]
-    }).sort("created_at", -1).skip(skip).limit(limit).to_list(length=None)
-    return [Message(**msg) for msg in reversed(messages)]
+@app.get("/api/messages/direct/{user_id}", response_model=List[Message])
+async def get_direct_messages(user_id: str, limit: int = Query(MESSAGE_PAGE_SIZE, ge=1, le=MAX_MESSAGE_PAGE_SIZE), before: Optional[datetime] = None, before_id: Optional[str] = None, current_user: User = Depends(get_current_user)):
+    message_filter = {
+        "conversation_id": conversation_key(current_user.id, user_id),
+        **message_page_filter(before, before_id)
+    }
+    
+    messages = await db.messages.aggregate(
+        message_page_pipeline(message_filter, limit)
+    ).to_list(length=None)
+    return message_page_response(messages, limit)
 
 @app.put("/api/messages/{message_id}", response_model=Message)
 async def edit_message(message_id: str, edit_data: MessageEdit, current_user: User = Depends(get_current_user)):
-    message = await db.messages.find_one({"id": message_id})
-    if not message:
-        raise HTTPException(status_code=404, detail="Message not found")
-    
-    if message["sender_id"] != current_user.id:
-        raise HTTPException(status_code=403, detail="Can only edit your own messages")
-    
-    # Update message
-    await db.messages.update_one(
-        {"id": message_id},
-        {"$set": {"content": edit_data.content, "edited_at": datetime.utcnow()}}
+    # Update the sender's own message and read it back in one round-trip
+    updated_message = await db.messages.find_one_and_update(
+        {"id": message_id, "sender_id": current_user.id},
+        {"$set": {"content": edit_data.content, "edited_at": datetime.utcnow()}},
+        projection=MESSAGE_PROJECTION,
+        return_document=ReturnDocument.AFTER
     )
+    if not updated_message:
+        # Only a failed edit pays for telling a missing message from someone else's
+        if await db.messages.find_one({"id": message_id}, {"_id": 1}):
+            raise HTTPException(status_code=403, detail="Can only edit your own messages")
+        raise HTTPException(status_code=404, detail="Message not found")
     
-    updated_message = await db.messages.find_one({"id": message_id})
-    message_obj = Message(**updated_message)
-    
-    # Broadcast edit via WebSocket
-    edit_message_dict = message_obj.dict()
-    edit_message_dict["type"] = "message_edited"
+    # Broadcast edit via WebSocket; the projected document already is the event body
+    edit_event = {**updated_message, "type": "message_edited"}
     
-    if message_obj.channel_id:
-        await manager.broadcast_to_channel(edit_message_dict, message_obj.channel_id)
-    elif message_obj.recipient_id:
-        await manager.send_personal_message(edit_message_dict, message_obj.recipient_id)
-        await manager.send_personal_message(edit_message_dict, current_user.id)
+    if updated_message.get("channel_id"):
+        await manager.broadcast_to_channel(edit_event, updated_message["channel_id"])
+    elif updated_message.get("recipient_id"):
+        await manager.send_to_users(edit_event, [updated_message["recipient_id"], current_user.id])
     
-    return message_obj
+    message_obj = Message.model_construct(**updated_message)
+    return Response(content=message_obj.model_dump_json(), media_type="application/json")
 
 @app.post("/api/messages/{message_id}/reactions")
 async def add_reaction(message_id: str, reaction_data: ReactionAdd, current_user: User = Depends(get_current_user)):
-    message = await db.messages.find_one({"id": message_id})
-    if not message:
-        raise HTTPException(status_code=404, detail="Message not found")
-    
-    # Add reaction
+    # The emoji becomes part of a field path, so reject anything that could alter it
     emoji = reaction_data.emoji
-    reactions = message.get("reactions", {})
+    if not emoji or "." in emoji or emoji.startswith("$") or "\x00" in emoji:
+        raise HTTPException(status_code=400, detail="Invalid emoji")
     
-    if emoji not in reactions:
-        reactions[emoji] = []
-    
-    if current_user.id not in reactions[emoji]:
-        reactions[emoji].append(current_user.id)
-    
-    await db.messages.update_one(
+    # Add reaction atomically and read back the resulting reactions
+    message = await db.messages.find_one_and_update(
         {"id": message_id},
-        {"$set": {"reactions": reactions}}
+        {"$addToSet": {f"reactions.{emoji}": current_user.id}},
+        projection={"_id": 0, "reactions": 1, "channel_id": 1, "recipient_id": 1, "sender_id": 1},
+        return_document=ReturnDocument.AFTER
     )
+    if not message:
+        raise HTTPException(status_code=404, detail="Message not found")
+    reactions = message["reactions"]
     
     # Broadcast reaction via WebSocket
     reaction_message = {
@@ -503,8 +1142,7 @@ async def add_reaction(message_id: str, reaction_data: ReactionAdd, current_user
     if message.get("channel_id"):
         await manager.broadcast_to_channel(reaction_message, message["channel_id"])
     elif message.get("recipient_id"):
-        await manager.send_personal_message(reaction_message, message["recipient_id"])
-        await manager.send_personal_message(reaction_message, message["sender_id"])
+        await manager.send_to_users(reaction_message, [message["recipient_id"], message["sender_id"]])
     
     return {"message": "Reaction added successfully"}
 
@@ -512,17 +1150,14 @@ async def add_reaction(message_id: str, reaction_data: ReactionAdd, current_user
 async def upload_file(file: UploadFile = File(...), current_user: User = Depends(get_current_user)):
     # Generate unique filename
     file_extension = Path(file.filename).suffix
-    unique_filename = f"{str(uuid.uuid4())}{file_extension}"
+    unique_filename = f"{secrets.token_hex(16)}{file_extension}"
     file_path = UPLOAD_DIR / unique_filename
     
-    # Save file
-    async with aiofiles.open(file_path, 'wb') as f:
-        content = await file.read()
-        await f.write(content)
+    # Save file in chunks on a single worker thread rather than one hop per chunk
+    size = await asyncio.to_thread(save_upload, file.file, file_path, file.size)
     
     # Determine file type
-    mime_type, _ = mimetypes.guess_type(str(file_path))
-    file_type = "image" if mime_type and mime_type.startswith("image/") else "file"
+    file_type = "image" if file_extension.lower() in IMAGE_EXTENSIONS else "file"
     
     file_url = f"/uploads/{unique_filename}"
     
@@ -530,7 +1165,7 @@ async def upload_file(file: UploadFile = File(...), current_user: User = Depends
         "file_url": file_url,
         "file_name": file.filename,
         "file_type": file_type,
-        "size": len(content)
+        "size": size
     }
 
 # WebSocket endpoint
@@ -538,31 +1173,37 @@ async def upload_file(file: UploadFile = File(...), current_user: User = Depends
 async def websocket_endpoint(websocket: WebSocket, token: str):
     try:
         # Verify token
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        payload = decode_access_token(token)
         user_id = payload.get("sub")
         
-        user = await db.users.find_one({"id": user_id})
+        user = await load_user(user_id)
         if not user:
             await websocket.close(code=1008)
             return
             
-        await manager.connect(websocket, user_id, user["username"])
+        await manager.connect(websocket, user_id, user.username)
         
-        try:
-            while True:
-                data = await websocket.receive_text()
-                # Handle incoming WebSocket messages if needed
-                
-        except WebSocketDisconnect:
-            await manager.disconnect(user_id, user["username"])
+        # Clients never send data, so wait for the close without decoding
+        # frames; uvicorn's ping keepalive detects peers that vanish silently
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+        await manager.disconnect(websocket, user_id, user.username)
             
     except jwt.PyJWTError:
         await websocket.close(code=1008)
 
+# Probes hit this often; the encoded body is reused within the same second
+_health_body = (0, b"")
+
 @app.get("/api/health")
 async def health_check():
-    return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
+    global _health_body
+    second = int(time.time())
+    if _health_body[0] != second:
+        _health_body = (second, orjson.dumps({"status": "healthy", "timestamp": datetime.utcnow()}, option=orjson.OPT_NAIVE_UTC))
+    return Response(content=_health_body[1], media_type="application/json")
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8001, loop="auto", http="httptools", access_log=False,
+                ws_ping_interval=20, ws_ping_timeout=20)
\ No newline at end of file
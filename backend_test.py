@@ -1,22 +1,154 @@
 #!/usr/bin/env python3
 
-import requests
+import asyncio
+import functools
+import itertools
+import httpx
+import io
 import sys
 import json
+import orjson
+import re
 import time
+import statistics
 from datetime import datetime, timedelta
+from pathlib import Path
 import uuid
 
+# API paths; parameterised ones are str.format templates taking `id`
+EP_HEALTH = '/api/health'
+EP_REGISTER = '/api/auth/register'
+EP_LOGIN = '/api/auth/login'
+EP_ME = '/api/auth/me'
+EP_USERS = '/api/users'
+EP_CHANNELS = '/api/channels'
+EP_CHANNEL_JOIN = '/api/channels/{id}/join'
+EP_CHANNEL_SETTINGS = '/api/channels/{id}/settings'
+EP_MESSAGES = '/api/messages'
+EP_MESSAGE = '/api/messages/{id}'
+EP_MESSAGE_REACTIONS = '/api/messages/{id}/reactions'
+EP_CHANNEL_MESSAGES = '/api/messages/channel/{id}'
+EP_DIRECT_MESSAGES = '/api/messages/direct/{id}'
+EP_UPLOAD = '/api/upload'
+EP_PLAYER_STATS = '/api/sports/stats'
+EP_TEAM_STATS = '/api/sports/stats/{id}'
+EP_GAME_SCHEDULE = '/api/sports/schedule'
+EP_TEAM_SCHEDULE = '/api/sports/schedule/{id}'
+EP_FLASHCARDS = '/api/study/flashcards'
+EP_CHANNEL_FLASHCARDS = '/api/study/flashcards/{id}'
+EP_STUDY_MATERIALS = '/api/study/materials'
+EP_CHANNEL_MATERIALS = '/api/study/materials/{id}'
+EP_SPRINT = '/api/agile/sprint'
+EP_ACTIVE_SPRINT = '/api/agile/sprint/{id}'
+EP_JIRA_WEBHOOK = '/api/agile/jira-webhook'
+EP_GITHUB_WEBHOOK = '/api/agile/github-webhook'
+
+# Read-only listings whose responses are reused for a few seconds within a run
+CACHEABLE_GETS = re.compile(
+    r"^/api/(users|channels"
+    r"|sports/(stats|schedule)/[^/]+"
+    r"|study/(flashcards|materials)/[^/]+"
+    r"|agile/sprint/[^/]+)$"
+)
+GET_CACHE_TTL = 5.0
+
+# Server-side cap on message content length (MAX_MESSAGE_LENGTH in server.py)
+MAX_MESSAGE_LENGTH = 4000
+
+# Request bodies are pre-encoded with orjson and sent as raw content
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
+# Ids in request paths collapse to {id} so timings bucket per route
+PATH_ID = re.compile(r"/[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+
+# Written with `--metrics` so CI can diff request timings across runs
+METRICS_FILE = Path("slacklite_test_metrics.json")
+
+# Per-process sequence behind the tags that make test payloads unique
+_SEQ = itertools.count()
+
+# Domain channel ids kept between runs, keyed by base URL; `--fresh` ignores them
+FIXTURE_FILE = Path(".slacklite_fixtures.json")
+
+def load_fixtures(base_url):
+    """Channel ids saved by earlier runs against base_url"""
+    try:
+        return json.loads(FIXTURE_FILE.read_text()).get(base_url, {})
+    except (OSError, ValueError):
+        return {}
+
+def save_fixtures(base_url, fixtures):
+    """Persist channel ids for later runs against base_url"""
+    try:
+        saved = json.loads(FIXTURE_FILE.read_text())
+    except (OSError, ValueError):
+        saved = {}
+    saved[base_url] = fixtures
+    FIXTURE_FILE.write_text(json.dumps(saved, indent=2))
+
+# Gateway statuses worth another attempt before a test is marked failed
+TRANSIENT_STATUS = re.compile(r"^Status 50[234]\b")
+
+def retry_flaky(attempts=3, delay=0.2):
+    """Retry a (success, response) request coroutine on transient gateway errors"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            for attempt in range(attempts):
+                success, response = await func(*args, **kwargs)
+                if success or not isinstance(response, str) or not TRANSIENT_STATUS.match(response):
+                    break
+                if attempt < attempts - 1:
+                    await asyncio.sleep(delay * 2 ** attempt)
+            return success, response
+        return wrapper
+    return decorator
+
+DEFAULT_BASE_URL = "https://quickmsg-35.preview.emergentagent.com"
+
+def create_client(base_url):
+    """Async client shared by every test against base_url"""
+    # Concurrent tests multiplex over a few keep-alive (HTTP/2 where
+    # offered) connections; failed connects are retried. With an explicit
+    # transport the client ignores its own http2/limits, so they live here
+    transport = httpx.AsyncHTTPTransport(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=16, max_connections=32),
+        retries=2
+    )
+    return httpx.AsyncClient(
+        base_url=base_url,
+        # Fail fast on unreachable hosts; a hung endpoint still can't stall the suite
+        timeout=httpx.Timeout(10.0, connect=3.0),
+        transport=transport
+    )
+
 class SlackLiteAPITester:
-    def __init__(self, base_url="https://quickmsg-35.preview.emergentagent.com"):
+    def __init__(self, base_url=DEFAULT_BASE_URL, fresh=False, client=None):
         self.base_url = base_url
+        # domain_type -> channel id, reused across runs unless fresh
+        self.fixtures = {} if fresh else load_fixtures(base_url)
         self.token = None
         self.user_id = None
+        # Bearer tokens by test user, for requests made as someone other than user1
+        self._tokens = {}
         self.username = None
         self.tests_run = 0
         self.tests_passed = 0
         
+        # Callers that own the client lifecycle (main, fixtures) inject it
+        self.client = client if client is not None else create_client(base_url)
+        # Caps requests in flight at once; timings feed the end-of-run summary
+        self._request_slots = asyncio.Semaphore(16)
+        # (method, route, seconds, status) per request sent
+        self._timings = []
+        # endpoint -> (monotonic time fetched, parsed body)
+        self._get_cache = {}
+        # Bumped by every write; a GET is only cached if none overlapped it
+        self._cache_generation = 0
+        
         # Test data
+        self._run_id = uuid.uuid4().hex[:8]
         timestamp = int(time.time())
         self.test_user_1 = {
             "username": f"testuser1_{timestamp}",
@@ -78,42 +210,89 @@ class SlackLiteAPITester:
             print(f"✅ {name} - PASSED")
         else:
             print(f"❌ {name} - FAILED: {details}")
-        
-    def make_request(self, method, endpoint, data=None, files=None, expected_status=200):
-        """Make HTTP request with proper headers"""
-        url = f"{self.base_url}{endpoint}"
-        headers = {'Content-Type': 'application/json'}
-        
-        if self.token:
-            headers['Authorization'] = f'Bearer {self.token}'
-            
-        if files:
-            # Remove content-type for file uploads
-            headers.pop('Content-Type', None)
-            
+    
+    def _tag(self):
+        """Unique, reproducible marker for test payload text"""
+        return f"{self._run_id}-{next(_SEQ)}"
+    
+    def latency_metrics(self):
+        """Request latency percentiles overall and per route, in milliseconds"""
+        def percentiles(seconds):
+            if len(seconds) < 2:
+                return {"count": len(seconds), "p50": seconds[0] * 1000 if seconds else None}
+            cuts = statistics.quantiles(seconds, n=100)
+            return {"count": len(seconds), "p50": cuts[49] * 1000,
+                    "p95": cuts[94] * 1000, "p99": cuts[98] * 1000}
+        
+        routes = {}
+        for method, route, seconds, _ in self._timings:
+            routes.setdefault(f"{method} {route}", []).append(seconds)
+        return {
+            "overall": percentiles([seconds for _, _, seconds, _ in self._timings]),
+            "routes": {route: percentiles(times) for route, times in sorted(routes.items())}
+        }
+    
+    def print_latency_summary(self, metrics):
+        """Print request latency percentiles for the run"""
+        overall = metrics["overall"]
+        if overall["count"] < 2:
+            return
+        print(f"⏱️  Request latency over {overall['count']} requests: "
+              f"p50 {overall['p50']:.1f} ms, p95 {overall['p95']:.1f} ms, p99 {overall['p99']:.1f} ms")
+        slowest = sorted(metrics["routes"].items(), key=lambda item: item[1]["p50"], reverse=True)
+        for route, stats in slowest[:5]:
+            print(f"   {route}: p50 {stats['p50']:.1f} ms over {stats['count']}")
+        
+    async def make_request(self, method, endpoint, data=None, files=None, expected_status=200, params=None, user=None, with_headers=False):
+        """Make HTTP request on the shared client as user1 (or user); with_headers returns (body, headers)"""
+        # The cache is keyed by endpoint alone, so parameterised GETs always go out
+        cacheable = (method == 'GET' and user is None and not with_headers and params is None
+                     and CACHEABLE_GETS.match(endpoint) is not None)
+        if cacheable:
+            cached = self._get_cache.get(endpoint)
+            if cached and time.monotonic() - cached[0] < GET_CACHE_TTL:
+                return True, cached[1]
+        elif method != 'GET':
+            self.invalidate_gets()
+        generation = self._cache_generation
+        
+        # user1's Authorization lives on client.headers and other users override
+        # it per call; httpx sets the multipart Content-Type for files= itself
+        body = None if data is None else orjson.dumps(data)
+        headers = JSON_HEADERS if body is not None else None
+        if user is not None:
+            headers = {**(headers or {}), 'Authorization': f'Bearer {self._tokens[user]}'}
         try:
-            if method == 'GET':
-                response = requests.get(url, headers=headers)
-            elif method == 'POST':
-                if files:
-                    response = requests.post(url, headers=headers, files=files)
-                else:
-                    response = requests.post(url, headers=headers, json=data)
-            elif method == 'PUT':
-                response = requests.put(url, headers=headers, json=data)
-            else:
-                return False, f"Unsupported method: {method}"
+            async with self._request_slots:
+                start = time.perf_counter()
+                response = await self.client.request(
+                    method, endpoint,
+                    content=body,
+                    headers=headers,
+                    files=files,
+                    params=params
+                )
+                self._timings.append((method, PATH_ID.sub("/{id}", endpoint),
+                                      time.perf_counter() - start, response.status_code))
+            if method != 'GET':
+                # GETs sent while this write was in flight may have read either side of it
+                self.invalidate_gets()
                 
             success = response.status_code == expected_status
             
             if success:
                 try:
-                    return True, response.json()
+                    parsed = orjson.loads(response.content)
                 except:
                     return True, response.text
+                if cacheable and generation == self._cache_generation:
+                    self._get_cache[endpoint] = (time.monotonic(), parsed)
+                if with_headers:
+                    return True, (parsed, response.headers)
+                return True, parsed
             else:
                 try:
-                    error_detail = response.json().get('detail', response.text)
+                    error_detail = orjson.loads(response.content).get('detail', response.text)
                 except:
                     error_detail = response.text
                 return False, f"Status {response.status_code}: {error_detail}"
@@ -121,18 +300,43 @@ class SlackLiteAPITester:
         except Exception as e:
             return False, f"Request failed: {str(e)}"
 
-    def test_health_check(self):
+    def invalidate_gets(self):
+        """Forget cached listings and any GET results still in flight"""
+        # Any write may change what a cached listing would return
+        self._get_cache.clear()
+        self._cache_generation += 1
+
+    async def wait_for(self, predicate, timeout=5.0, initial=0.05):
+        """Poll an async predicate with growing backoff until it holds or timeout passes"""
+        deadline = time.monotonic() + timeout
+        while True:
+            if await predicate():
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            await asyncio.sleep(min(initial, remaining))
+            initial *= 1.6
+
+    @retry_flaky(attempts=3)
+    async def post_webhook(self, endpoint, data):
+        """POST a webhook payload, retrying transient gateway errors"""
+        return await self.make_request('POST', endpoint, data)
+
+    async def test_health_check(self):
         """Test health endpoint"""
-        success, response = self.make_request('GET', '/api/health')
+        success, response = await self.make_request('GET', EP_HEALTH)
         self.log_test("Health Check", success, "" if success else response)
         return success
 
-    def test_user_registration(self):
+    async def test_user_registration(self):
         """Test user registration"""
-        success, response = self.make_request('POST', '/api/auth/register', self.test_user_1)
+        success, response = await self.make_request('POST', EP_REGISTER, self.test_user_1)
         
         if success and 'access_token' in response:
             self.token = response['access_token']
+            self.client.headers['Authorization'] = f'Bearer {self.token}'
+            self._tokens['user1'] = self.token
             self.user_id = response['user']['id']
             self.username = response['user']['username']
             self.log_test("User Registration", True)
@@ -141,14 +345,14 @@ class SlackLiteAPITester:
             self.log_test("User Registration", False, response)
             return False
 
-    def test_user_login(self):
+    async def test_user_login(self):
         """Test user login"""
         login_data = {
             "username": self.test_user_1["username"],
             "password": self.test_user_1["password"]
         }
         
-        success, response = self.make_request('POST', '/api/auth/login', login_data)
+        success, response = await self.make_request('POST', EP_LOGIN, login_data)
         
         if success and 'access_token' in response:
             self.log_test("User Login", True)
@@ -157,9 +361,9 @@ class SlackLiteAPITester:
             self.log_test("User Login", False, response)
             return False
 
-    def test_get_current_user(self):
+    async def test_get_current_user(self):
         """Test get current user endpoint"""
-        success, response = self.make_request('GET', '/api/auth/me')
+        success, response = await self.make_request('GET', EP_ME)
         
         if success and 'username' in response:
             self.log_test("Get Current User", True)
@@ -168,20 +372,21 @@ class SlackLiteAPITester:
             self.log_test("Get Current User", False, response)
             return False
 
-    def test_create_second_user(self):
+    async def test_create_second_user(self):
         """Create second user for testing interactions"""
-        success, response = self.make_request('POST', '/api/auth/register', self.test_user_2)
+        success, response = await self.make_request('POST', EP_REGISTER, self.test_user_2)
         
         if success and 'access_token' in response:
+            self._tokens['user2'] = response['access_token']
             self.log_test("Create Second User", True)
             return response['user']['id']
         else:
             self.log_test("Create Second User", False, response)
             return None
 
-    def test_get_users(self):
+    async def test_get_users(self):
         """Test get all users endpoint"""
-        success, response = self.make_request('GET', '/api/users')
+        success, response = await self.make_request('GET', EP_USERS)
         
         if success and isinstance(response, list):
             self.log_test("Get Users List", True)
@@ -190,10 +395,10 @@ class SlackLiteAPITester:
             self.log_test("Get Users List", False, response)
             return False
 
-    def test_create_enhanced_channel(self, channel_type="general"):
+    async def test_create_enhanced_channel(self, channel_type="general"):
         """Test enhanced channel creation with new features"""
         channel_data = self.test_channels[channel_type]
-        success, response = self.make_request('POST', '/api/channels', channel_data)
+        success, response = await self.make_request('POST', EP_CHANNELS, channel_data)
         
         if success and 'id' in response:
             # Verify all new fields are present
@@ -210,14 +415,28 @@ class SlackLiteAPITester:
             self.log_test(f"Create {channel_type.title()} Channel", False, response)
             return None
 
-    def test_create_channel(self):
+    async def ensure_channel(self, domain_type):
+        """Reuse this domain's channel from an earlier run, creating it if it is gone"""
+        channel_id = self.fixtures.get(domain_type)
+        if channel_id:
+            success, channels = await self.make_request('GET', EP_CHANNELS)
+            if success and any(channel['id'] == channel_id for channel in channels):
+                self.log_test(f"Reuse {domain_type.title()} Channel", True)
+                return channel_id
+        
+        channel_id = await self.test_create_enhanced_channel(domain_type)
+        if channel_id:
+            self.fixtures[domain_type] = channel_id
+        return channel_id
+
+    async def test_create_channel(self):
         """Test basic channel creation (backward compatibility)"""
         basic_channel = {
             "name": f"basic_test_{int(time.time())}",
             "description": "Basic test channel",
             "is_public": True
         }
-        success, response = self.make_request('POST', '/api/channels', basic_channel)
+        success, response = await self.make_request('POST', EP_CHANNELS, basic_channel)
         
         if success and 'id' in response:
             self.log_test("Create Basic Channel", True)
@@ -226,9 +445,9 @@ class SlackLiteAPITester:
             self.log_test("Create Basic Channel", False, response)
             return None
 
-    def test_get_channels(self):
+    async def test_get_channels(self):
         """Test get channels endpoint"""
-        success, response = self.make_request('GET', '/api/channels')
+        success, response = await self.make_request('GET', EP_CHANNELS)
         
         if success and isinstance(response, list):
             self.log_test("Get Channels List", True)
@@ -237,9 +456,9 @@ class SlackLiteAPITester:
             self.log_test("Get Channels List", False, response)
             return False
 
-    def test_join_channel(self, channel_id):
+    async def test_join_channel(self, channel_id):
         """Test joining a channel"""
-        success, response = self.make_request('POST', f'/api/channels/{channel_id}/join')
+        success, response = await self.make_request('POST', EP_CHANNEL_JOIN.format(id=channel_id))
         
         if success:
             self.log_test("Join Channel", True)
@@ -248,14 +467,14 @@ class SlackLiteAPITester:
             self.log_test("Join Channel", False, response)
             return False
 
-    def test_send_channel_message(self, channel_id):
+    async def test_send_channel_message(self, channel_id):
         """Test sending message to channel"""
         message_data = {
-            "content": f"Test message from {self.username} at {datetime.now().isoformat()}",
+            "content": f"Test message from {self.username} tag {self._tag()}",
             "channel_id": channel_id
         }
         
-        success, response = self.make_request('POST', '/api/messages', message_data)
+        success, response = await self.make_request('POST', EP_MESSAGES, message_data)
         
         if success and 'id' in response:
             self.log_test("Send Channel Message", True)
@@ -264,14 +483,14 @@ class SlackLiteAPITester:
             self.log_test("Send Channel Message", False, response)
             return None
 
-    def test_send_direct_message(self, recipient_id):
+    async def test_send_direct_message(self, recipient_id):
         """Test sending direct message"""
         message_data = {
-            "content": f"Direct message from {self.username} at {datetime.now().isoformat()}",
+            "content": f"Direct message from {self.username} tag {self._tag()}",
             "recipient_id": recipient_id
         }
         
-        success, response = self.make_request('POST', '/api/messages', message_data)
+        success, response = await self.make_request('POST', EP_MESSAGES, message_data)
         
         if success and 'id' in response:
             self.log_test("Send Direct Message", True)
@@ -280,9 +499,9 @@ class SlackLiteAPITester:
             self.log_test("Send Direct Message", False, response)
             return None
 
-    def test_get_channel_messages(self, channel_id):
+    async def test_get_channel_messages(self, channel_id):
         """Test getting channel messages"""
-        success, response = self.make_request('GET', f'/api/messages/channel/{channel_id}')
+        success, response = await self.make_request('GET', EP_CHANNEL_MESSAGES.format(id=channel_id))
         
         if success and isinstance(response, list):
             self.log_test("Get Channel Messages", True)
@@ -291,9 +510,9 @@ class SlackLiteAPITester:
             self.log_test("Get Channel Messages", False, response)
             return False
 
-    def test_get_direct_messages(self, user_id):
+    async def test_get_direct_messages(self, user_id):
         """Test getting direct messages"""
-        success, response = self.make_request('GET', f'/api/messages/direct/{user_id}')
+        success, response = await self.make_request('GET', EP_DIRECT_MESSAGES.format(id=user_id))
         
         if success and isinstance(response, list):
             self.log_test("Get Direct Messages", True)
@@ -302,13 +521,82 @@ class SlackLiteAPITester:
             self.log_test("Get Direct Messages", False, response)
             return False
 
-    def test_edit_message(self, message_id):
+    async def test_recipient_direct_messages(self, message_id):
+        """Test the recipient sees the same conversation from their side"""
+        success, response = await self.make_request('GET', EP_DIRECT_MESSAGES.format(id=self.user_id), user='user2')
+        
+        if success and isinstance(response, list) and any(m['id'] == message_id for m in response):
+            self.log_test("Get Direct Messages As Recipient", True)
+            return True
+        else:
+            self.log_test("Get Direct Messages As Recipient", False, response if not success else "Message missing from recipient's history")
+            return False
+
+    async def test_direct_message_paging(self, recipient_id, first_message_id):
+        """Test history pages follow the X-Next-Before cursor without gaps or repeats"""
+        # Two more messages make three, so a page of two leaves one behind the cursor
+        for _ in range(2):
+            success, response = await self.make_request('POST', EP_MESSAGES, {
+                "content": f"Paging message tag {self._tag()}",
+                "recipient_id": recipient_id
+            })
+            if not success:
+                self.log_test("Direct Message Paging", False, response)
+                return False
+        
+        endpoint = EP_DIRECT_MESSAGES.format(id=recipient_id)
+        success, response = await self.make_request('GET', endpoint, params={"limit": 2}, with_headers=True)
+        if not success:
+            self.log_test("Direct Message Paging", False, response)
+            return False
+        newest, headers = response
+        cursor = {"before": headers.get('X-Next-Before'), "before_id": headers.get('X-Next-Before-Id')}
+        if len(newest) != 2 or not all(cursor.values()):
+            self.log_test("Direct Message Paging", False, f"Expected a full page with a cursor, got {len(newest)} messages")
+            return False
+        
+        success, response = await self.make_request('GET', endpoint, params={"limit": 2, **cursor}, with_headers=True)
+        if not success:
+            self.log_test("Direct Message Paging", False, response)
+            return False
+        older, headers = response
+        older_ids = [m['id'] for m in older]
+        if older_ids != [first_message_id] or 'X-Next-Before' in headers:
+            self.log_test("Direct Message Paging", False, f"Unexpected second page: {older_ids}")
+            return False
+        
+        # A tie-breaker without its timestamp is a malformed cursor, not "no cursor"
+        success, response = await self.make_request('GET', endpoint, params={"before_id": cursor["before_id"]}, expected_status=422)
+        if not success:
+            self.log_test("Direct Message Paging", False, f"before_id without before was not rejected: {response}")
+            return False
+        
+        self.log_test("Direct Message Paging", True)
+        return True
+
+    async def test_message_too_long(self, channel_id):
+        """Test content over the length cap is rejected"""
+        message_data = {
+            "content": "x" * (MAX_MESSAGE_LENGTH + 1),
+            "channel_id": channel_id
+        }
+        
+        success, response = await self.make_request('POST', EP_MESSAGES, message_data, expected_status=422)
+        
+        if success:
+            self.log_test("Reject Oversized Message", True)
+            return True
+        else:
+            self.log_test("Reject Oversized Message", False, response)
+            return False
+
+    async def test_edit_message(self, message_id):
         """Test editing a message"""
         edit_data = {
-            "content": f"Edited message at {datetime.now().isoformat()}"
+            "content": f"Edited message tag {self._tag()}"
         }
         
-        success, response = self.make_request('PUT', f'/api/messages/{message_id}', edit_data)
+        success, response = await self.make_request('PUT', EP_MESSAGE.format(id=message_id), edit_data)
         
         if success and 'content' in response:
             self.log_test("Edit Message", True)
@@ -317,13 +605,13 @@ class SlackLiteAPITester:
             self.log_test("Edit Message", False, response)
             return False
 
-    def test_add_reaction(self, message_id):
+    async def test_add_reaction(self, message_id):
         """Test adding reaction to message"""
         reaction_data = {
             "emoji": "👍"
         }
         
-        success, response = self.make_request('POST', f'/api/messages/{message_id}/reactions', reaction_data)
+        success, response = await self.make_request('POST', EP_MESSAGE_REACTIONS.format(id=message_id), reaction_data)
         
         if success:
             self.log_test("Add Reaction", True)
@@ -332,13 +620,14 @@ class SlackLiteAPITester:
             self.log_test("Add Reaction", False, response)
             return False
 
-    def test_file_upload(self):
+    async def test_file_upload(self):
         """Test file upload functionality"""
         # Create a simple test file
         test_content = b"This is a test file for SlackLite API testing"
-        files = {'file': ('test.txt', test_content, 'text/plain')}
+        # A file object lets httpx stream the multipart body in chunks
+        files = {'file': ('test.txt', io.BytesIO(test_content), 'text/plain')}
         
-        success, response = self.make_request('POST', '/api/upload', files=files)
+        success, response = await self.make_request('POST', EP_UPLOAD, files=files)
         
         if success and 'file_url' in response:
             self.log_test("File Upload", True)
@@ -347,7 +636,7 @@ class SlackLiteAPITester:
             self.log_test("File Upload", False, response)
             return None
 
-    def test_update_channel_settings(self, channel_id):
+    async def test_update_channel_settings(self, channel_id):
         """Test updating channel settings"""
         settings_data = {
             "ttl_enabled": True,
@@ -356,7 +645,7 @@ class SlackLiteAPITester:
             "domain_config": {"updated": True}
         }
         
-        success, response = self.make_request('PUT', f'/api/channels/{channel_id}/settings', settings_data)
+        success, response = await self.make_request('PUT', EP_CHANNEL_SETTINGS.format(id=channel_id), settings_data)
         
         if success:
             self.log_test("Update Channel Settings", True)
@@ -365,20 +654,29 @@ class SlackLiteAPITester:
             self.log_test("Update Channel Settings", False, response)
             return False
 
-    def test_ephemeral_message(self, channel_id):
+    async def test_ephemeral_message(self, channel_id):
         """Test ephemeral message creation in TTL-enabled channel"""
         message_data = {
-            "content": f"Ephemeral test message at {datetime.now().isoformat()}",
+            "content": f"Ephemeral test message tag {self._tag()}",
             "channel_id": channel_id
         }
         
-        success, response = self.make_request('POST', '/api/messages', message_data)
+        success, response = await self.make_request('POST', EP_MESSAGES, message_data)
         
         if success and 'id' in response:
             # Check if message has ephemeral properties
             if response.get('is_ephemeral') and response.get('expires_at'):
+                message_id = response['id']
+                
+                async def visible():
+                    ok, messages = await self.make_request('GET', EP_CHANNEL_MESSAGES.format(id=channel_id))
+                    return ok and any(m['id'] == message_id and m.get('is_ephemeral') for m in messages)
+                
+                if not await self.wait_for(visible):
+                    self.log_test("Send Ephemeral Message", False, "Message not visible in channel history")
+                    return None
                 self.log_test("Send Ephemeral Message", True)
-                return response['id']
+                return message_id
             else:
                 self.log_test("Send Ephemeral Message", False, "Message not marked as ephemeral")
                 return None
@@ -387,7 +685,7 @@ class SlackLiteAPITester:
             return None
 
     # Sports Team Domain Tests
-    def test_create_player_stats(self, channel_id):
+    async def test_create_player_stats(self, channel_id):
         """Test creating player stats for sports channel"""
         stats_data = {
             "channel_id": channel_id,
@@ -398,28 +696,19 @@ class SlackLiteAPITester:
             "rebounds": 30
         }
         
-        success, response = self.make_request('POST', '/api/sports/stats', None, None, 200)
-        # Add query parameters manually
-        url = f"{self.base_url}/api/sports/stats"
-        headers = {'Authorization': f'Bearer {self.token}'}
+        # Domain endpoints read their fields from the query string
+        success, response = await self.make_request('POST', EP_PLAYER_STATS, params=stats_data)
         
-        try:
-            response = requests.post(url, headers=headers, params=stats_data)
-            success = response.status_code == 200
-            
-            if success:
-                self.log_test("Create Player Stats", True)
-                return True
-            else:
-                self.log_test("Create Player Stats", False, f"Status {response.status_code}: {response.text}")
-                return False
-        except Exception as e:
-            self.log_test("Create Player Stats", False, str(e))
+        if success:
+            self.log_test("Create Player Stats", True)
+            return True
+        else:
+            self.log_test("Create Player Stats", False, response)
             return False
 
-    def test_get_team_stats(self, channel_id):
+    async def test_get_team_stats(self, channel_id):
         """Test getting team stats"""
-        success, response = self.make_request('GET', f'/api/sports/stats/{channel_id}')
+        success, response = await self.make_request('GET', EP_TEAM_STATS.format(id=channel_id))
         
         if success and isinstance(response, list):
             self.log_test("Get Team Stats", True)
@@ -428,9 +717,9 @@ class SlackLiteAPITester:
             self.log_test("Get Team Stats", False, response)
             return False
 
-    def test_create_game_schedule(self, channel_id):
+    async def test_create_game_schedule(self, channel_id, now):
         """Test creating game schedule"""
-        future_date = (datetime.now() + timedelta(days=7)).isoformat()
+        future_date = (now + timedelta(days=7)).isoformat()
         schedule_data = {
             "channel_id": channel_id,
             "date": future_date,
@@ -438,26 +727,19 @@ class SlackLiteAPITester:
             "location": "Test Stadium"
         }
         
-        url = f"{self.base_url}/api/sports/schedule"
-        headers = {'Authorization': f'Bearer {self.token}'}
+        # Domain endpoints read their fields from the query string
+        success, response = await self.make_request('POST', EP_GAME_SCHEDULE, params=schedule_data)
         
-        try:
-            response = requests.post(url, headers=headers, params=schedule_data)
-            success = response.status_code == 200
-            
-            if success:
-                self.log_test("Create Game Schedule", True)
-                return True
-            else:
-                self.log_test("Create Game Schedule", False, f"Status {response.status_code}: {response.text}")
-                return False
-        except Exception as e:
-            self.log_test("Create Game Schedule", False, str(e))
+        if success:
+            self.log_test("Create Game Schedule", True)
+            return True
+        else:
+            self.log_test("Create Game Schedule", False, response)
             return False
 
-    def test_get_team_schedule(self, channel_id):
+    async def test_get_team_schedule(self, channel_id):
         """Test getting team schedule"""
-        success, response = self.make_request('GET', f'/api/sports/schedule/{channel_id}')
+        success, response = await self.make_request('GET', EP_TEAM_SCHEDULE.format(id=channel_id))
         
         if success and isinstance(response, list):
             self.log_test("Get Team Schedule", True)
@@ -467,7 +749,7 @@ class SlackLiteAPITester:
             return False
 
     # Study Group Domain Tests
-    def test_create_flashcard(self, channel_id):
+    async def test_create_flashcard(self, channel_id):
         """Test creating flashcard for study channel"""
         flashcard_data = {
             "channel_id": channel_id,
@@ -478,26 +760,19 @@ class SlackLiteAPITester:
             "tags": ["geography", "capitals", "europe"]
         }
         
-        url = f"{self.base_url}/api/study/flashcards"
-        headers = {'Authorization': f'Bearer {self.token}'}
+        # Domain endpoints read their fields from the query string
+        success, response = await self.make_request('POST', EP_FLASHCARDS, params=flashcard_data)
         
-        try:
-            response = requests.post(url, headers=headers, params=flashcard_data)
-            success = response.status_code == 200
-            
-            if success:
-                self.log_test("Create Flashcard", True)
-                return True
-            else:
-                self.log_test("Create Flashcard", False, f"Status {response.status_code}: {response.text}")
-                return False
-        except Exception as e:
-            self.log_test("Create Flashcard", False, str(e))
+        if success:
+            self.log_test("Create Flashcard", True)
+            return True
+        else:
+            self.log_test("Create Flashcard", False, response)
             return False
 
-    def test_get_flashcards(self, channel_id):
+    async def test_get_flashcards(self, channel_id):
         """Test getting flashcards"""
-        success, response = self.make_request('GET', f'/api/study/flashcards/{channel_id}')
+        success, response = await self.make_request('GET', EP_CHANNEL_FLASHCARDS.format(id=channel_id))
         
         if success and isinstance(response, list):
             self.log_test("Get Flashcards", True)
@@ -506,7 +781,7 @@ class SlackLiteAPITester:
             self.log_test("Get Flashcards", False, response)
             return False
 
-    def test_create_study_material(self, channel_id):
+    async def test_create_study_material(self, channel_id):
         """Test creating study material"""
         material_data = {
             "channel_id": channel_id,
@@ -517,26 +792,19 @@ class SlackLiteAPITester:
             "description": "Test material for API testing"
         }
         
-        url = f"{self.base_url}/api/study/materials"
-        headers = {'Authorization': f'Bearer {self.token}'}
+        # Domain endpoints read their fields from the query string
+        success, response = await self.make_request('POST', EP_STUDY_MATERIALS, params=material_data)
         
-        try:
-            response = requests.post(url, headers=headers, params=material_data)
-            success = response.status_code == 200
-            
-            if success:
-                self.log_test("Create Study Material", True)
-                return True
-            else:
-                self.log_test("Create Study Material", False, f"Status {response.status_code}: {response.text}")
-                return False
-        except Exception as e:
-            self.log_test("Create Study Material", False, str(e))
+        if success:
+            self.log_test("Create Study Material", True)
+            return True
+        else:
+            self.log_test("Create Study Material", False, response)
             return False
 
-    def test_get_study_materials(self, channel_id):
+    async def test_get_study_materials(self, channel_id):
         """Test getting study materials"""
-        success, response = self.make_request('GET', f'/api/study/materials/{channel_id}')
+        success, response = await self.make_request('GET', EP_CHANNEL_MATERIALS.format(id=channel_id))
         
         if success and isinstance(response, list):
             self.log_test("Get Study Materials", True)
@@ -546,10 +814,10 @@ class SlackLiteAPITester:
             return False
 
     # Agile/DevOps Domain Tests
-    def test_create_sprint(self, channel_id):
+    async def test_create_sprint(self, channel_id, now):
         """Test creating sprint for agile channel"""
-        start_date = datetime.now().isoformat()
-        end_date = (datetime.now() + timedelta(days=14)).isoformat()
+        start_date = now.isoformat()
+        end_date = (now + timedelta(days=14)).isoformat()
         
         sprint_data = {
             "channel_id": channel_id,
@@ -559,26 +827,19 @@ class SlackLiteAPITester:
             "story_points_planned": 50
         }
         
-        url = f"{self.base_url}/api/agile/sprint"
-        headers = {'Authorization': f'Bearer {self.token}'}
+        # Domain endpoints read their fields from the query string
+        success, response = await self.make_request('POST', EP_SPRINT, params=sprint_data)
         
-        try:
-            response = requests.post(url, headers=headers, params=sprint_data)
-            success = response.status_code == 200
-            
-            if success:
-                self.log_test("Create Sprint", True)
-                return True
-            else:
-                self.log_test("Create Sprint", False, f"Status {response.status_code}: {response.text}")
-                return False
-        except Exception as e:
-            self.log_test("Create Sprint", False, str(e))
+        if success:
+            self.log_test("Create Sprint", True)
+            return True
+        else:
+            self.log_test("Create Sprint", False, response)
             return False
 
-    def test_get_active_sprint(self, channel_id):
+    async def test_get_active_sprint(self, channel_id):
         """Test getting active sprint"""
-        success, response = self.make_request('GET', f'/api/agile/sprint/{channel_id}')
+        success, response = await self.make_request('GET', EP_ACTIVE_SPRINT.format(id=channel_id))
         
         # Note: This might return None if no active sprint, which is valid
         if success:
@@ -588,7 +849,7 @@ class SlackLiteAPITester:
             self.log_test("Get Active Sprint", False, response)
             return False
 
-    def test_jira_webhook(self):
+    async def test_jira_webhook(self):
         """Test Jira webhook endpoint"""
         webhook_data = {
             "webhookEvent": "jira:issue_updated",
@@ -603,7 +864,7 @@ class SlackLiteAPITester:
             }
         }
         
-        success, response = self.make_request('POST', '/api/agile/jira-webhook', webhook_data)
+        success, response = await self.post_webhook(EP_JIRA_WEBHOOK, webhook_data)
         
         if success:
             self.log_test("Jira Webhook", True)
@@ -612,7 +873,7 @@ class SlackLiteAPITester:
             self.log_test("Jira Webhook", False, response)
             return False
 
-    def test_github_webhook(self):
+    async def test_github_webhook(self):
         """Test GitHub webhook endpoint"""
         webhook_data = {
             "action": "opened",
@@ -625,7 +886,7 @@ class SlackLiteAPITester:
             }
         }
         
-        success, response = self.make_request('POST', '/api/agile/github-webhook', webhook_data)
+        success, response = await self.post_webhook(EP_GITHUB_WEBHOOK, webhook_data)
         
         if success:
             self.log_test("GitHub Webhook", True)
@@ -634,129 +895,104 @@ class SlackLiteAPITester:
             self.log_test("GitHub Webhook", False, response)
             return False
 
-    def run_all_tests(self):
+    async def run_graph(self, graph):
+        """Run each test once its dependencies pass, skipping those whose dependencies failed"""
+        results = {}
+        
+        async def run(name):
+            deps, test = graph[name]
+            await asyncio.gather(*(tasks[dep] for dep in deps))
+            blocked = [dep for dep in deps if not results[dep]]
+            if blocked:
+                # Counted as a failure so a broken setup step can't raise the pass rate
+                self.log_test(name, False, f"skipped, needs {', '.join(blocked)}")
+                results[name] = None
+            else:
+                results[name] = await test(results)
+        
+        # Every task exists before any of them runs, so dependencies resolve
+        tasks = {name: asyncio.ensure_future(run(name)) for name in graph}
+        await asyncio.gather(*tasks.values())
+        return results
+
+    async def run_all_tests(self):
         """Run comprehensive API test suite including new features"""
         print("🚀 Starting Enhanced SlackLite API Test Suite")
         print(f"📡 Testing endpoint: {self.base_url}")
         print("=" * 80)
         
-        # Health check
-        if not self.test_health_check():
-            print("❌ Health check failed - stopping tests")
-            return False
-            
-        # Authentication tests
-        if not self.test_user_registration():
-            print("❌ User registration failed - stopping tests")
-            return False
+        # Wall-clock reference for the scheduling tests
+        now = datetime.now()
+        
+        # name -> (dependencies, test); a test starts once every dependency
+        # has passed and receives their results, keyed by name
+        graph = {
+            'health': ([], lambda r: self.test_health_check()),
+            'register': (['health'], lambda r: self.test_user_registration()),
+            'login': (['register'], lambda r: self.test_user_login()),
+            'me': (['login'], lambda r: self.test_get_current_user()),
+            'second_user': (['health'], lambda r: self.test_create_second_user()),
+            'users': (['me'], lambda r: self.test_get_users()),
+            'channels': (['me'], lambda r: self.test_get_channels()),
+            'upload': (['me'], lambda r: self.test_file_upload()),
+            'jira_webhook': (['health'], lambda r: self.test_jira_webhook()),
+            'github_webhook': (['health'], lambda r: self.test_github_webhook()),
             
-        if not self.test_user_login():
-            print("❌ User login failed - stopping tests")
-            return False
+            # Enhanced channels per domain type, plus basic creation (backward compatibility)
+            'general': (['me'], lambda r: self.ensure_channel('general')),
+            'sports': (['me'], lambda r: self.ensure_channel('sports')),
+            'study': (['me'], lambda r: self.ensure_channel('study')),
+            'agile': (['me'], lambda r: self.ensure_channel('agile')),
+            'basic': (['me'], lambda r: self.test_create_channel()),
+            'channel_settings': (['basic'], lambda r: self.test_update_channel_settings(r['basic'])),
             
-        if not self.test_get_current_user():
-            print("❌ Get current user failed - stopping tests")
-            return False
-        
-        # Create second user for interaction tests
-        second_user_id = self.test_create_second_user()
-        if not second_user_id:
-            print("⚠️  Second user creation failed - skipping interaction tests")
-        
-        # User management tests
-        self.test_get_users()
-        
-        print("\n🔧 Testing Enhanced Channel Features...")
-        
-        # Test enhanced channel creation for each domain type
-        channel_ids = {}
-        for domain_type in ['general', 'sports', 'study', 'agile']:
-            channel_id = self.test_create_enhanced_channel(domain_type)
-            if channel_id:
-                channel_ids[domain_type] = channel_id
-        
-        # Test basic channel creation (backward compatibility)
-        basic_channel_id = self.test_create_channel()
-        if basic_channel_id:
-            channel_ids['basic'] = basic_channel_id
-        
-        self.test_get_channels()
-        
-        print("\n⚡ Testing Ephemeral Messaging...")
-        
-        # Test ephemeral messaging in sports channel (has TTL enabled)
-        if 'sports' in channel_ids:
-            sports_channel_id = channel_ids['sports']
-            self.test_join_channel(sports_channel_id)
-            ephemeral_msg_id = self.test_ephemeral_message(sports_channel_id)
+            # Ephemeral messaging in the sports channel (has TTL enabled)
+            'join_sports': (['sports'], lambda r: self.test_join_channel(r['sports'])),
+            'ephemeral': (['join_sports'], lambda r: self.test_ephemeral_message(r['sports'])),
+            'sports_history': (['ephemeral'], lambda r: self.test_get_channel_messages(r['sports'])),
             
-            if ephemeral_msg_id:
-                self.test_get_channel_messages(sports_channel_id)
-        
-        # Test channel settings update
-        if 'basic' in channel_ids:
-            self.test_update_channel_settings(channel_ids['basic'])
-        
-        print("\n🏀 Testing Sports Domain Features...")
-        
-        # Sports domain tests
-        if 'sports' in channel_ids:
-            sports_id = channel_ids['sports']
-            self.test_create_player_stats(sports_id)
-            self.test_get_team_stats(sports_id)
-            self.test_create_game_schedule(sports_id)
-            self.test_get_team_schedule(sports_id)
-        
-        print("\n📚 Testing Study Group Features...")
-        
-        # Study domain tests
-        if 'study' in channel_ids:
-            study_id = channel_ids['study']
-            self.test_join_channel(study_id)
-            self.test_create_flashcard(study_id)
-            self.test_get_flashcards(study_id)
-            self.test_create_study_material(study_id)
-            self.test_get_study_materials(study_id)
-        
-        print("\n🚀 Testing Agile/DevOps Features...")
-        
-        # Agile domain tests
-        if 'agile' in channel_ids:
-            agile_id = channel_ids['agile']
-            self.test_join_channel(agile_id)
-            self.test_create_sprint(agile_id)
-            self.test_get_active_sprint(agile_id)
-        
-        # Webhook tests
-        self.test_jira_webhook()
-        self.test_github_webhook()
-        
-        print("\n💬 Testing Core Messaging Features...")
-        
-        # Core messaging tests
-        if 'general' in channel_ids:
-            general_id = channel_ids['general']
-            self.test_join_channel(general_id)
+            # Sports domain
+            'player_stats': (['join_sports'], lambda r: self.test_create_player_stats(r['sports'])),
+            'team_stats': (['join_sports'], lambda r: self.test_get_team_stats(r['sports'])),
+            'game_schedule': (['join_sports'], lambda r: self.test_create_game_schedule(r['sports'], now)),
+            'team_schedule': (['join_sports'], lambda r: self.test_get_team_schedule(r['sports'])),
             
-            # Message tests
-            message_id = self.test_send_channel_message(general_id)
-            if message_id:
-                self.test_get_channel_messages(general_id)
-                self.test_edit_message(message_id)
-                self.test_add_reaction(message_id)
+            # Study group domain
+            'join_study': (['study'], lambda r: self.test_join_channel(r['study'])),
+            'flashcard': (['join_study'], lambda r: self.test_create_flashcard(r['study'])),
+            'flashcards': (['join_study'], lambda r: self.test_get_flashcards(r['study'])),
+            'study_material': (['join_study'], lambda r: self.test_create_study_material(r['study'])),
+            'study_materials': (['join_study'], lambda r: self.test_get_study_materials(r['study'])),
             
-            # Direct message tests
-            if second_user_id:
-                dm_message_id = self.test_send_direct_message(second_user_id)
-                if dm_message_id:
-                    self.test_get_direct_messages(second_user_id)
+            # Agile/DevOps domain
+            'join_agile': (['agile'], lambda r: self.test_join_channel(r['agile'])),
+            'sprint': (['join_agile'], lambda r: self.test_create_sprint(r['agile'], now)),
+            'active_sprint': (['join_agile'], lambda r: self.test_get_active_sprint(r['agile'])),
             
-            # File upload test
-            self.test_file_upload()
+            # Core messaging
+            'join_general': (['general'], lambda r: self.test_join_channel(r['general'])),
+            'message': (['join_general'], lambda r: self.test_send_channel_message(r['general'])),
+            'message_too_long': (['join_general'], lambda r: self.test_message_too_long(r['general'])),
+            'general_history': (['message'], lambda r: self.test_get_channel_messages(r['general'])),
+            'edit': (['message'], lambda r: self.test_edit_message(r['message'])),
+            'reaction': (['message'], lambda r: self.test_add_reaction(r['message'])),
+            'direct_message': (['me', 'second_user'], lambda r: self.test_send_direct_message(r['second_user'])),
+            'direct_history': (['direct_message'], lambda r: self.test_get_direct_messages(r['second_user'])),
+            'direct_paging': (['direct_message'], lambda r: self.test_direct_message_paging(r['second_user'], r['direct_message'])),
+            'recipient_history': (['direct_message'], lambda r: self.test_recipient_direct_messages(r['direct_message'])),
+        }
+        results = await self.run_graph(graph)
+        # Without these nothing else is meaningful, as when they stopped the run outright
+        setup_failed = [name for name in ('health', 'register', 'login', 'me') if not results[name]]
         
         # Print results
         print("=" * 80)
         print(f"📊 Test Results: {self.tests_passed}/{self.tests_run} tests passed")
+        self.print_latency_summary(self.latency_metrics())
+        
+        if setup_failed:
+            print(f"❌ Setup failed ({', '.join(setup_failed)}) - dependent tests were skipped")
+            return False
         
         if self.tests_passed == self.tests_run:
             print("🎉 All tests passed! Enhanced SlackLite API is working correctly.")
@@ -774,19 +1010,26 @@ class SlackLiteAPITester:
                 print("❌ Significant issues detected. Backend needs attention.")
                 return False
 
-def main():
+async def main():
     """Main test execution"""
-    tester = SlackLiteAPITester()
-    
+    fresh = "--fresh" in sys.argv[1:]
     try:
-        success = tester.run_all_tests()
+        async with create_client(DEFAULT_BASE_URL) as client:
+            tester = SlackLiteAPITester(DEFAULT_BASE_URL, fresh=fresh, client=client)
+            try:
+                success = await tester.run_all_tests()
+            finally:
+                save_fixtures(tester.base_url, tester.fixtures)
+                if "--metrics" in sys.argv[1:]:
+                    METRICS_FILE.write_text(json.dumps(tester.latency_metrics(), indent=2))
         return 0 if success else 1
-    except KeyboardInterrupt:
-        print("\n🛑 Tests interrupted by user")
-        return 1
     except Exception as e:
         print(f"\n💥 Unexpected error: {str(e)}")
         return 1
 
 if __name__ == "__main__":
-    sys.exit(main())
\ No newline at end of file
+    try:
+        sys.exit(asyncio.run(main()))
+    except KeyboardInterrupt:
+        print("\n🛑 Tests interrupted by user")
+        sys.exit(1)
@@ -127,28 +127,50 @@ function App() {
   useEffect(() => {
     if (token && user) {
       const wsUrl = `${API_URL.replace('http', 'ws')}/api/ws/${token}`;
-      const websocket = new WebSocket(wsUrl);
+      // Events arrive as binary frames of UTF-8 encoded JSON
+      const decoder = new TextDecoder();
+      let websocket = null;
+      let reconnectTimer = null;
+      let reconnectDelay = 1000;
+      let closedByUs = false;
 
-      websocket.onopen = () => {
-        console.log('WebSocket connected');
-        setWs(websocket);
-      };
+      const connect = () => {
+        websocket = new WebSocket(wsUrl);
+        websocket.binaryType = 'arraybuffer';
 
-      websocket.onmessage = (event) => {
-        const data = JSON.parse(event.data);
-        handleWebSocketMessage(data);
-      };
+        websocket.onopen = () => {
+          console.log('WebSocket connected');
+          reconnectDelay = 1000;
+          setWs(websocket);
+        };
 
-      websocket.onclose = () => {
-        console.log('WebSocket disconnected');
-        setWs(null);
-      };
+        websocket.onmessage = (event) => {
+          const text = typeof event.data === 'string' ? event.data : decoder.decode(event.data);
+          const data = JSON.parse(text);
+          // The server coalesces events queued in the same tick into one array
+          (Array.isArray(data) ? data : [data]).forEach(handleWebSocketMessage);
+        };
 
-      websocket.onerror = (error) => {
-        console.error('WebSocket error:', error);
+        websocket.onclose = (event) => {
+          console.log('WebSocket disconnected');
+          setWs(null);
+          // 1008 means the token was rejected; anything else (including 1013,
+          // sent to clients that fell behind) reconnects with backoff
+          if (closedByUs || event.code === 1008) return;
+          reconnectTimer = setTimeout(connect, reconnectDelay);
+          reconnectDelay = Math.min(reconnectDelay * 2, 30000);
+        };
+
+        websocket.onerror = (error) => {
+          console.error('WebSocket error:', error);
+        };
       };
 
+      connect();
+
       return () => {
+        closedByUs = true;
+        clearTimeout(reconnectTimer);
         websocket.close();
       };
     }
@@ -180,13 +202,16 @@ function App() {
         toast.info('Message expired and deleted');
         break;
       case 'user_status':
+      case 'presence_bulk':
         setOnlineUsers(prev => {
           const newSet = new Set(prev);
-          if (data.is_online) {
-            newSet.add(data.user_id);
-          } else {
-            newSet.delete(data.user_id);
-          }
+          (data.changes || [data]).forEach(change => {
+            if (change.is_online) {
+              newSet.add(change.user_id);
+            } else {
+              newSet.delete(change.user_id);
+            }
+          });
           return newSet;
         });
         break;